@@ -0,0 +1,172 @@
+"""
+Purpose: Benchmarks phoneticNoiser.py on synthetic transcript corpora so
+         changes to noise / control can be compared across commits.
+         Every scenario (sentence length x vocabulary size x percent) is
+         generated locally and timed in a fresh process, once per noise
+         type on its own and once for the full mix. Homophones come from
+         a synthetic offline index, so no wordhoard/network lookups are made.
+
+         Parameters:
+            > --sentence-lengths : Comma separated words per sentence
+            > --vocab-sizes : Comma separated vocabulary sizes
+            > --percents : Comma separated noising percents
+            > --sentences : Sentences per corpus
+            > --noise-types : Comma separated noise types to time on their own
+                              (assimilation, homophone, manner); the mix is always timed
+            > --workers : Worker processes to noise with
+            > --seed : Seed for the corpora and the noising
+            > --output : JSON lines file to append results to
+            > --compare : JSON lines file from an earlier run to compare against
+
+Output:
+    -> table of seconds, sentences/sec and tokens/sec per noise type plus peak RSS
+    -> (optional) one JSON line per scenario tagged with the git commit
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+import phoneticNoiser
+from bench_utils import append_result, git_commit, load_results, parse_list, peak_rss_mb, run_fresh
+from homophone_index import build_index
+
+# Letters weighted roughly like English text so manner swaps see realistic bigrams
+LETTER_WEIGHTS = {c: w for c, w in zip(string.ascii_lowercase,
+                  [8, 2, 3, 4, 13, 2, 2, 6, 7, 1, 1, 4, 2, 7, 8, 2, 1, 6, 6, 9, 3, 1, 2, 1, 2, 1])}
+
+
+def make_vocabulary(vocab_size: int, rng: random.Random) -> list:
+    """
+    :returns: [list] vocab_size distinct made-up words of 1 to 9 letters
+    """
+    letters, weights = list(LETTER_WEIGHTS), list(LETTER_WEIGHTS.values())
+    vocab = set()
+    while len(vocab) < vocab_size:
+        length = min(1 + int(rng.expovariate(1 / 4)), 9)
+        vocab.add("".join(rng.choices(letters, weights, k=length)))
+    return sorted(vocab)
+
+
+def make_corpus(corpus_path: str, index_path: str, sentences: int, sentence_length: int,
+                vocab_size: int, seed: int = 0) -> None:
+    """
+    Writes a synthetic transcript file (words drawn with a Zipf-like
+    distribution) and a homophone index where about half of the
+    vocabulary has one to three homophones.
+
+    :params: corpus_path - transcript file to write, index_path - homophone
+    index to write, sentences - number of lines, sentence_length - words
+    per line, vocab_size - vocabulary size, seed - RNG seed
+    :returns: None
+    """
+    rng = random.Random(seed)
+    vocab = make_vocabulary(vocab_size, rng)
+    zipf = [1 / (rank + 1) for rank in range(len(vocab))]
+    with open(corpus_path, 'w', encoding='utf-8') as file:
+        for _ in range(sentences):
+            file.write(" ".join(rng.choices(vocab, zipf, k=sentence_length)) + "\n")
+    homophones = {}
+    for word in vocab:
+        if rng.random() < 0.5:
+            homophones[word] = set(rng.sample(vocab, rng.randint(1, 3))) - {word}
+    build_index(homophones, index_path)
+
+
+def run_scenario(corpus_path: str, index_path: str, scenario: dict, guidebook: dict) -> dict:
+    """
+    Times noising one corpus with one guidebook. Meant to run in a fresh
+    process so the peak RSS and the lookup caches belong to this run alone.
+
+    :params: corpus_path - transcript file, index_path - homophone index,
+    scenario - the scenario settings, guidebook - noise types and costs
+    :returns: [dict] scenario settings plus timings and noising stats
+    """
+    phoneticNoiser.load_homophone_index(index_path)
+    stats = phoneticNoiser.enable_stats()
+    lines = phoneticNoiser.read_file(corpus_path)
+    tokens = sum(len(line.split()) for line in lines)
+
+    start = time.perf_counter()
+    phoneticNoiser.compile_manner_tables({word for line in lines for word in line.split()})
+    compile_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in phoneticNoiser.iter_noised(lines, [scenario["percent"]], guidebook, scenario["seed"],
+                                        scenario["workers"]):
+        pass
+    seconds = time.perf_counter() - start
+
+    result = dict(scenario)
+    result["sentences_total"] = len(lines)
+    result["tokens"] = tokens
+    result["compile_seconds"] = compile_seconds
+    result["seconds"] = seconds
+    result["sentences_per_sec"] = len(lines) / seconds if seconds > 0 else None
+    result["tokens_per_sec"] = tokens / seconds if seconds > 0 else None
+    result["stats"] = stats.to_dict()
+    rss = peak_rss_mb()
+    result["peak_rss_mb"] = None if rss is None else round(rss, 1)
+    return result
+
+
+def scenario_key(result: dict) -> tuple:
+    return (result["sentence_length"], result["vocab_size"], result["percent"], result["sentences"],
+            result["noise_type"], result["workers"])
+
+
+def print_result(result: dict, baseline: dict = None) -> None:
+    types = result["stats"]["types"]
+    success = ", ".join(f"{t}={c['success_rate']:.2f}" for t, c in types.items() if c["success_rate"] is not None)
+    line = f"  {result['noise_type']:<13} {result['seconds']:>8.3f}s {result['sentences_per_sec'] or 0:>11.1f} sent/s " \
+           f"{result['tokens_per_sec'] or 0:>12.1f} tok/s  RSS={result['peak_rss_mb']} MB  success: {success}"
+    if baseline is not None and result["seconds"] > 0:
+        line += f"   x{baseline['seconds'] / result['seconds']:.2f} vs {baseline.get('commit')}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentence-lengths", default="5,20,80", help="Comma separated words per sentence")
+    parser.add_argument("--vocab-sizes",      default="1000,20000", help="Comma separated vocabulary sizes")
+    parser.add_argument("--percents",         default="0.1,0.3", help="Comma separated noising percents")
+    parser.add_argument("--sentences",        default=2000, type=int, help="Sentences per corpus")
+    parser.add_argument("--noise-types",      default="assimilation,homophone,manner",
+                        help="Comma separated noise types to time on their own (the mix is always timed)")
+    parser.add_argument("--workers",          default=1, type=int, help="Worker processes to noise with")
+    parser.add_argument("--seed",             default=0, type=int, help="Seed for the corpora and the noising")
+    parser.add_argument("--output",           default=None, help="JSON lines file to append results to")
+    parser.add_argument("--compare",          default=None, help="JSON lines file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    guidebooks = {t: {t: phoneticNoiser.DEFAULT_GUIDEBOOK[t]} for t in parse_list(args.noise_types, str)}
+    guidebooks["mix"] = dict(phoneticNoiser.DEFAULT_GUIDEBOOK)
+    baselines = {} if args.compare is None else load_results(args.compare, scenario_key)
+
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        for sentence_length in parse_list(args.sentence_lengths, int):
+            for vocab_size in parse_list(args.vocab_sizes, int):
+                corpus_path = os.path.join(tmp, f"corpus_{sentence_length}w_{vocab_size}v.txt")
+                index_path = os.path.join(tmp, f"homophones_{vocab_size}v.idx")
+                make_corpus(corpus_path, index_path, args.sentences, sentence_length, vocab_size, args.seed)
+                for percent in parse_list(args.percents, float):
+                    print(f"\nsentence length={sentence_length} vocab={vocab_size} percent={percent} "
+                          f"sentences={args.sentences} workers={args.workers}")
+                    for noise_type, guidebook in guidebooks.items():
+                        scenario = {"sentence_length": sentence_length, "vocab_size": vocab_size,
+                                    "percent": percent, "sentences": args.sentences, "noise_type": noise_type,
+                                    "workers": args.workers, "seed": args.seed}
+                        # Fresh process per scenario so peak RSS and caches are not shared between scenarios
+                        result = run_fresh(run_scenario, corpus_path, index_path, scenario, guidebook)
+                        result["commit"] = commit
+                        result["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                        print_result(result, baselines.get(scenario_key(result)))
+                        if args.output is not None:
+                            append_result(args.output, result)
+
+
+if __name__ == "__main__":
+    main()
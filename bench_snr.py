@@ -0,0 +1,224 @@
+"""
+Purpose: Benchmarks the get_avg_snr.py pipeline on synthetic WAV corpora so
+         changes to get_snr / get_average_snr can be compared across commits.
+         Every scenario (clip length x file count x bit depth x channels)
+         is generated locally, with the discovery, decode and compute
+         stages timed in one fresh process and an end-to-end run through
+         the worker pool per estimator, each in its own fresh process so
+         every stage reports its own peak RSS.
+
+         Parameters:
+            > --clip-seconds : Comma separated clip lengths in seconds
+            > --files : Comma separated file counts
+            > --bit-depths : Comma separated bit depths (8, 16 or 32)
+            > --channels : Comma separated channel counts
+            > --sample-rate : Sample rate of the synthetic audio
+            > --workers : Worker processes for the end-to-end stage
+            > --estimators : Comma separated estimators to time (basic, streaming, segmental)
+            > --output : JSON lines file to append results to
+            > --compare : JSON lines file from an earlier run to compare against
+            > --corpus-dir : Keep the generated corpora here instead of a temp directory
+
+Output:
+    -> table of seconds, files/sec, audio-hours/sec and peak RSS per stage
+    -> (optional) one JSON line per scenario tagged with the git commit
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import scipy.io.wavfile as wavfile
+
+import get_avg_snr
+from bench_utils import append_result, git_commit, load_results, parse_list, peak_rss_mb, run_fresh
+
+SAMPLE_TYPES = {8: np.uint8, 16: np.int16, 32: np.int32}
+
+
+def make_corpus(corpus_dir: str, files: int, clip_seconds: float, bit_depth: int,
+                channels: int, sample_rate: int, seed: int = 0) -> None:
+    """
+    Writes a synthetic corpus of speech-like clips (tone bursts over
+    white noise) spread over speaker sub-directories, like a real corpus.
+
+    :params: corpus_dir - directory to write to, files - number of clips,
+    clip_seconds - length of each clip, bit_depth - 8, 16 or 32, channels -
+    channel count, sample_rate - sample rate, seed - RNG seed
+    :returns: None
+    """
+    rng = np.random.default_rng(seed)
+    dtype = SAMPLE_TYPES[bit_depth]
+    info = np.iinfo(dtype)
+    n = int(clip_seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    for i in range(files):
+        speaker_dir = os.path.join(corpus_dir, f"speaker{i % 20:02d}")
+        os.makedirs(speaker_dir, exist_ok=True)
+        bursts = (np.sin(2 * np.pi * rng.uniform(0.3, 1.0) * t) > 0)
+        signal = np.sin(2 * np.pi * rng.uniform(100, 400) * t) * bursts
+        signal = signal + rng.uniform(0.01, 0.3) * rng.standard_normal(n)
+        signal = np.clip(signal / max(np.abs(signal).max(), 1e-9), -1, 1)
+        if channels > 1:
+            signal = np.repeat(signal[:, None], channels, axis=1)
+        mid = (int(info.max) + int(info.min)) / 2
+        half = (int(info.max) - int(info.min)) / 2
+        samples = (mid + signal * half * 0.9).astype(dtype)
+        wavfile.write(os.path.join(speaker_dir, f"clip{i:06d}.wav"), sample_rate, samples)
+
+
+def rates(seconds: float, files: int, audio_hours: float) -> dict:
+    return {
+        "seconds": seconds,
+        "files_per_sec": files / seconds if seconds > 0 else None,
+        "audio_hours_per_sec": audio_hours / seconds if seconds > 0 else None,
+    }
+
+
+def stage_rss(stages: dict) -> dict:
+    """
+    Tags every stage timed in this process with the process's peak RSS.
+    """
+    rss = peak_rss_mb()
+    for r in stages.values():
+        r["peak_rss_mb"] = None if rss is None else round(rss, 1)
+    return stages
+
+
+def time_decode_compute(corpus_dir: str, scenario: dict, estimators: list) -> dict:
+    """
+    Times discovery, decoding every file and the in-memory estimators.
+
+    :params: corpus_dir - directory holding the generated corpus,
+    scenario - the scenario settings, estimators - estimator names to time
+    :returns: [dict] stage name -> timings and peak RSS
+    """
+    files = scenario["files"]
+    audio_hours = files * scenario["clip_seconds"] / 3600
+    stages = {}
+
+    start = time.perf_counter()
+    paths = list(get_avg_snr.find_audio_files(corpus_dir, "wav"))
+    stages["discovery"] = rates(time.perf_counter() - start, files, audio_hours)
+    assert len(paths) == files, f"Expected {files} files, found {len(paths)}"
+
+    # The streaming estimator decodes as it computes so it only has an end-to-end timing
+    decode_seconds = 0.0
+    compute_seconds = {name: 0.0 for name in estimators if name in ("basic", "segmental")}
+    for path in paths:
+        start = time.perf_counter()
+        rate, a = wavfile.read(path)
+        decode_seconds += time.perf_counter() - start
+        for name in compute_seconds:
+            start = time.perf_counter()
+            if name == "basic":
+                get_avg_snr.compute_snr(a)
+            else:
+                get_avg_snr.compute_segmental_snr(rate, a)
+            compute_seconds[name] += time.perf_counter() - start
+    stages["decode"] = rates(decode_seconds, files, audio_hours)
+    for name, seconds in compute_seconds.items():
+        stages[f"compute_{name}"] = rates(seconds, files, audio_hours)
+    return stage_rss(stages)
+
+
+def time_end_to_end(corpus_dir: str, scenario: dict, estimator: str, workers: int) -> dict:
+    """
+    Times one estimator end to end through get_avg_snr.iter_snrs.
+
+    :params: corpus_dir - directory holding the generated corpus,
+    scenario - the scenario settings, estimator - estimator name,
+    workers - worker processes
+    :returns: [dict] stage name -> timings and peak RSS
+    """
+    files = scenario["files"]
+    audio_hours = files * scenario["clip_seconds"] / 3600
+    snr_fns = {"basic": get_avg_snr.get_snr,
+               "streaming": get_avg_snr.get_snr_streaming,
+               "segmental": get_avg_snr.get_segmental_snr}
+    paths = list(get_avg_snr.find_audio_files(corpus_dir, "wav"))
+    start = time.perf_counter()
+    for _ in get_avg_snr.iter_snrs(paths, workers, snr_fn=snr_fns[estimator]):
+        pass
+    stages = {f"end_to_end_{estimator}": rates(time.perf_counter() - start, files, audio_hours)}
+    return stage_rss(stages)
+
+
+def run_scenario(corpus_dir: str, scenario: dict, estimators: list, workers: int) -> dict:
+    """
+    Times one scenario. The decode/compute stages and every end-to-end
+    estimator run in their own fresh process, so each gets its own peak
+    RSS (the streaming estimator is not charged for decoding whole files).
+
+    :params: corpus_dir - directory holding the generated corpus,
+    scenario - the scenario settings, estimators - estimator names to
+    time, workers - worker processes for the end-to-end stage
+    :returns: [dict] scenario settings plus per-stage timings and peak RSS
+    """
+    result = dict(scenario)
+    result["stages"] = run_fresh(time_decode_compute, corpus_dir, scenario, estimators)
+    for name in estimators:
+        result["stages"].update(run_fresh(time_end_to_end, corpus_dir, scenario, name, workers))
+    peaks = [r["peak_rss_mb"] for r in result["stages"].values() if r["peak_rss_mb"] is not None]
+    result["peak_rss_mb"] = max(peaks) if peaks else None
+    return result
+
+
+def scenario_key(result: dict) -> tuple:
+    return (result["clip_seconds"], result["files"], result["bit_depth"], result["channels"],
+            result["sample_rate"], result["workers"])
+
+
+def print_result(result: dict, baseline: dict = None) -> None:
+    print(f"\nclip={result['clip_seconds']}s files={result['files']} bits={result['bit_depth']} "
+          f"channels={result['channels']} workers={result['workers']}")
+    for stage, r in result["stages"].items():
+        line = f"  {stage:<22} {r['seconds']:>9.3f}s {r['files_per_sec'] or 0:>11.1f} files/s " \
+               f"{r['audio_hours_per_sec'] or 0:>9.3f} audio-h/s  RSS={r.get('peak_rss_mb')} MB"
+        if baseline is not None and stage in baseline["stages"] and r["seconds"] > 0:
+            line += f"   x{baseline['stages'][stage]['seconds'] / r['seconds']:.2f} vs {baseline.get('commit')}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clip-seconds", default="2,30",   help="Comma separated clip lengths in seconds")
+    parser.add_argument("--files",        default="200",    help="Comma separated file counts")
+    parser.add_argument("--bit-depths",   default="16",     help="Comma separated bit depths (8, 16 or 32)")
+    parser.add_argument("--channels",     default="1,2",    help="Comma separated channel counts")
+    parser.add_argument("--sample-rate",  default=16000, type=int, help="Sample rate of the synthetic audio")
+    parser.add_argument("--workers",      default=1,     type=int, help="Worker processes for the end-to-end stage")
+    parser.add_argument("--estimators",   default="basic,streaming,segmental", help="Comma separated estimators to time")
+    parser.add_argument("--output",       default=None,  help="JSON lines file to append results to")
+    parser.add_argument("--compare",      default=None,  help="JSON lines file from an earlier run to compare against")
+    parser.add_argument("--corpus-dir",   default=None,  help="Keep generated corpora here (reused if present)")
+    args = parser.parse_args()
+
+    estimators = parse_list(args.estimators, str)
+    baselines = {} if args.compare is None else load_results(args.compare, scenario_key)
+
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = args.corpus_dir or tmp
+        for clip_seconds in parse_list(args.clip_seconds, float):
+            for files in parse_list(args.files, int):
+                for bit_depth in parse_list(args.bit_depths, int):
+                    for channels in parse_list(args.channels, int):
+                        scenario = {"clip_seconds": clip_seconds, "files": files, "bit_depth": bit_depth,
+                                    "channels": channels, "sample_rate": args.sample_rate,
+                                    "workers": args.workers}
+                        corpus_dir = os.path.join(
+                            base_dir, f"corpus_{clip_seconds}s_{files}f_{bit_depth}b_{channels}ch_{args.sample_rate}hz")
+                        if not os.path.isdir(corpus_dir):
+                            make_corpus(corpus_dir, files, clip_seconds, bit_depth, channels, args.sample_rate)
+                        result = run_scenario(corpus_dir, scenario, estimators, args.workers)
+                        result["commit"] = commit
+                        result["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                        print_result(result, baselines.get(scenario_key(result)))
+                        if args.output is not None:
+                            append_result(args.output, result)
+
+
+if __name__ == "__main__":
+    main()
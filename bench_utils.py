@@ -0,0 +1,76 @@
+"""
+Purpose: Helpers shared by the benchmark scripts (bench_snr.py and
+         bench_noiser.py): peak RSS, the git commit results are tagged
+         with, list arguments, loading earlier results to compare
+         against and running a function in a fresh process.
+"""
+import json
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then reported as None
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    :returns: [float] peak resident set size of this process (and its
+    finished children) in MB, or None where the resource module is missing
+    """
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_list(value: str, cast) -> list:
+    return [cast(v) for v in value.split(',') if v != ""]
+
+
+def load_results(path: str, key) -> dict:
+    """
+    Reads a JSON lines results file written with --output.
+
+    :params: path - results file, key - function mapping a result to its
+    scenario key
+    :returns: [dict] scenario key -> result (the last one wins)
+    """
+    results = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                result = json.loads(line)
+                results[key(result)] = result
+    return results
+
+
+def run_fresh(fn, *args):
+    """
+    Runs fn(*args) in a fresh process so its peak RSS (and any caches)
+    belong to that call alone.
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def append_result(path: str, result: dict) -> None:
+    """
+    Appends one result as a JSON line to a --output results file.
+    """
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(result) + "\n")
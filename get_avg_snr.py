@@ -1,73 +1,702 @@
-"""
-Author: Riah Coulter
-Date: October 12, 2021 (Updated December 21, 2021)
-Purpose: Computes average signal-to-noise ratio for given folder of audio files
-Parameters:
-    path-to-audio-files - path to individual audio files from which average SNR is calculated
-"""
-import scipy.io.wavfile as wavfile
-import argparse
-#from scipy import stats -> deprecated
-import numpy as np
-import os
-
-def get_snr(file):
-    """
-    Takes an audio file, opens it, calculates the SNR for the individual
-    audio file then returns the SNR.
-    
-    :params: [str] path to specific audio file
-    :returns: [float] SNR value
-    """
-    if (os.path.isfile(file)):
-        axis = 0
-        ddof = 0
-        a = wavfile.read(file)[1]
-        mx = np.amax(a)
-        a  = np.divide(a,mx)
-        a  = np.square(a)
-        a  = np.asanyarray(a)
-        m  = a.mean(axis)
-        sd = a.std(axis=axis, ddof=ddof)
-        return np.where(sd == 0, 0, m/sd)
-    else:
-        print(f"{file} not found.")
-        return 0
-
-
-def get_average_snr(folder_dir: str, file_type: str):
-    """
-    Iterates through all audio files that end with given
-    file type (default=wav), gets the SNR for each audio
-    file then prints the average SNR over all audio files.
-
-    :params: [str] folder_dir - path to file containing target
-    audio files, [str] file_type - type of audio file to search
-    for (wav, mp3, etc.)
-    :returns: Nothing. Prints average SNR over audio files.
-    """
-    total = 0
-    count = 0
-    for root, _, files in os.walk(folder_dir):
-        for name in files:
-            if name.endswith(f'.{file_type}'):
-                path = os.path.join(root, name)
-                snr  = get_snr(path)
-                total += snr
-                count += 1
-    try:
-        print(f"\nFolder: {folder_dir}")
-        print(f"\nAverage SNR:\n{total/count}dB")
-    except ZeroDivisionError:
-        print('ZeroDivisionError: Files not processed correctly. Check file format.')
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--path-to-audio-files", required=True, help='Path to individual audio files (MUST BE .wav) to be processed.')
-    parser.add_argument("--audio-file-type", required=False, default='wav', help='Type of audio file. Examples include: wav, mp3, etc.')
-    args = parser.parse_args()
-    print('\nFILE TYPE:', args.audio_file_type)
-    get_average_snr(args.path_to_audio_files, args.audio_file_type)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+"""
+Author: Riah Coulter
+Date: October 12, 2021 (Updated December 21, 2021)
+Purpose: Computes average signal-to-noise ratio for given folder of audio files
+Parameters:
+    path-to-audio-files - path to individual audio files from which average SNR is calculated
+    workers - number of processes used to compute SNRs (default=1, no pool)
+    chunk-size - number of files handed to a worker process at a time
+    streaming - compute each SNR block by block from a memory-mapped file
+    block-size - frames per block in streaming mode
+    float32 - use float32 instead of float64 for the streaming math
+    estimator - basic (default) or segmental (frame-level SNR in dB with VAD)
+    frame-ms / hop-ms / vad-db - framing and VAD settings for the segmental estimator
+    index - SQLite SNR index so reruns only compute new or changed files
+    manifest / file-list - read the audio file paths from a fairseq manifest
+        tsv or a plain file list instead of walking path-to-audio-files
+    discovery-workers - list directories in parallel with os.scandir
+    report - JSON report of the SNR distribution (percentiles, histogram, min/max/count)
+    hist-min / hist-max / hist-bins - range and bins of the report histogram
+        (the default range depends on the estimator)
+"""
+import scipy.io.wavfile as wavfile
+import argparse
+#from scipy import stats -> deprecated
+import numpy as np
+import os
+import json
+import math
+import sqlite3
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+# Default report histogram range per estimator: basic returns a plain ratio
+# (mean/std of the squared signal, usually around 0.5-1.5), segmental dB
+HIST_RANGES = {'basic': (0.0, 3.0), 'segmental': (-10.0, 40.0)}
+
+def compute_snr(a):
+    """
+    Calculates the SNR of already decoded audio samples.
+
+    :params: [np.ndarray] a - audio samples (frames x channels)
+    :returns: [float] SNR value
+    """
+    axis = 0
+    ddof = 0
+    mx = np.amax(a)
+    a  = np.divide(a,mx)
+    a  = np.square(a)
+    a  = np.asanyarray(a)
+    m  = a.mean(axis)
+    sd = a.std(axis=axis, ddof=ddof)
+    return np.where(sd == 0, 0, m/sd)
+
+
+def get_snr(file):
+    """
+    Takes an audio file, opens it, calculates the SNR for the individual
+    audio file then returns the SNR.
+    
+    :params: [str] path to specific audio file
+    :returns: [float] SNR value
+    """
+    if (os.path.isfile(file)):
+        return compute_snr(wavfile.read(file)[1])
+    else:
+        print(f"{file} not found.")
+        return 0
+
+
+def get_snr_streaming(file, block_size: int = 1 << 20, dtype=np.float64):
+    """
+    Streaming version of get_snr for long recordings. The WAV file is
+    memory-mapped and the max, mean and variance of the squared signal
+    are accumulated block by block in a single pass (block means and
+    variances are merged with Chan's parallel update), so peak memory is
+    bounded by block_size no matter how long the file is. Because the
+    mean and standard deviation are both divided by the square of the
+    max, the max is only applied once at the end.
+
+    Note: 24-bit WAV files cannot be memory-mapped by scipy so they are
+    read in full and then processed in blocks.
+
+    :params: [str] file - path to specific audio file, [int] block_size -
+    number of frames processed at a time, dtype - float type used for the
+    per-block math (np.float32 halves the block memory)
+    :returns: [float] SNR value (matches get_snr within float tolerance)
+    """
+    if not os.path.isfile(file):
+        print(f"{file} not found.")
+        return 0
+    try:
+        a = wavfile.read(file, mmap=True)[1]
+    except ValueError:
+        a = wavfile.read(file)[1]
+    mx = None
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for start in range(0, len(a), block_size):
+        block = np.asarray(a[start:start + block_size])
+        block_mx = np.amax(block)
+        mx = block_mx if mx is None else max(mx, block_mx)
+        sq = block.astype(dtype)
+        np.square(sq, out=sq)
+        n = len(sq)
+        block_mean = sq.mean(axis=0, dtype=np.float64)
+        block_m2 = np.square(sq - block_mean.astype(dtype)).sum(axis=0, dtype=np.float64)
+        # Merge block statistics into the running totals
+        delta = block_mean - mean
+        total = count + n
+        mean = mean + delta * n / total
+        m2 = m2 + block_m2 + np.square(delta) * count * n / total
+        count = total
+    del a
+    if count == 0:
+        raise ValueError(f"{file} contains no audio frames.")
+    scale = np.float64(mx) ** 2
+    m  = mean / scale
+    sd = np.sqrt(m2 / count) / scale
+    return np.where(sd == 0, 0, m/sd)
+
+
+def compute_segmental_snr(rate: int, a, frame_ms: float = 20, hop_ms: float = 10, vad_db: float = 3,
+                          noise_percentile: float = 10, min_db: float = -10, max_db: float = 35):
+    """
+    Segmental SNR estimate with a simple energy-based voice activity
+    detector (VAD). The signal (mixed down to mono) is cut into
+    overlapping frames using a zero-copy strided view and every frame
+    energy is computed at once with einsum, so there is no Python loop
+    over frames. The noise floor is the noise_percentile-th percentile
+    of the frame energies; frames more than vad_db above the floor are
+    treated as speech and the rest as noise. The SNR of each speech
+    frame is clipped to [min_db, max_db] and averaged.
+
+    :params: [int] rate - sample rate, [np.ndarray] a - decoded audio
+    samples (frames x channels), [float] frame_ms / hop_ms - frame length
+    and hop in milliseconds, [float] vad_db - dB above the noise floor
+    for a frame to count as speech, [float] noise_percentile - percentile
+    of frame energies used as noise floor, [float] min_db / max_db -
+    per-frame SNR clipping range
+    :returns: [float] segmental SNR in dB (min_db if no speech is found)
+    """
+    if a.ndim > 1:
+        a = a.mean(axis=1)
+    a = np.asarray(a, dtype=np.float64)
+    if len(a) == 0:
+        raise ValueError("Signal contains no audio frames.")
+    frame_len = max(1, min(len(a), int(rate * frame_ms / 1000)))
+    hop = max(1, int(rate * hop_ms / 1000))
+    frames = np.lib.stride_tricks.sliding_window_view(a, frame_len)[::hop]
+    energy = np.einsum('ij,ij->i', frames, frames) / frame_len
+    eps = np.finfo(np.float64).tiny
+    energy_db = 10 * np.log10(energy + eps)
+    speech = energy_db > np.percentile(energy_db, noise_percentile) + vad_db
+    if not speech.any():
+        return float(min_db)
+    noise_power = max(energy[~speech].mean(), eps)
+    signal_power = np.maximum(energy[speech] - noise_power, eps)
+    frame_snr = np.clip(10 * np.log10(signal_power / noise_power), min_db, max_db)
+    return float(frame_snr.mean())
+
+
+def get_segmental_snr(file, frame_ms: float = 20, hop_ms: float = 10, vad_db: float = 3,
+                      noise_percentile: float = 10, min_db: float = -10, max_db: float = 35):
+    """
+    Opens an audio file and returns its segmental SNR (see
+    compute_segmental_snr for the estimator and its settings).
+
+    :params: [str] file - path to specific audio file, remaining
+    params are passed to compute_segmental_snr
+    :returns: [float] segmental SNR in dB (min_db if no speech is found)
+    """
+    if not os.path.isfile(file):
+        print(f"{file} not found.")
+        return 0
+    rate, a = wavfile.read(file)
+    return compute_segmental_snr(rate, a, frame_ms, hop_ms, vad_db, noise_percentile, min_db, max_db)
+
+
+def find_audio_files(folder_dir: str, file_type: str):
+    """
+    Walks the given folder and yields the path of every
+    audio file that ends with the given file type.
+
+    :params: [str] folder_dir - path to file containing target
+    audio files, [str] file_type - type of audio file to search for
+    :returns: [generator] paths to audio files
+    """
+    for root, _, files in os.walk(folder_dir):
+        for name in files:
+            if name.endswith(f'.{file_type}'):
+                yield os.path.join(root, name)
+
+
+def scan_dir(dir_path: str, file_type: str):
+    """
+    Lists one directory with os.scandir (which gets the file type from
+    the directory entry, so no extra stat calls are made).
+
+    :params: [str] dir_path - directory to list, [str] file_type - type
+    of audio file to search for
+    :returns: [list] matching audio file paths, [list] sub-directories
+    """
+    files = []
+    dirs = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.endswith(f'.{file_type}'):
+                    files.append(entry.path)
+    except OSError as e:
+        print(f"Could not read {dir_path}: {e}")
+    return files, dirs
+
+
+def find_audio_files_parallel(folder_dir: str, file_type: str, workers: int = 8):
+    """
+    Parallel version of find_audio_files for slow (network) filesystems.
+    Directories are listed with os.scandir on a thread pool so many
+    listings are in flight at once. Results are consumed in submission
+    (breadth-first) order so the file order does not depend on timing.
+
+    :params: [str] folder_dir - path to file containing target audio
+    files, [str] file_type - type of audio file to search for, [int]
+    workers - number of directory listings run at once
+    :returns: [generator] paths to audio files
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        queue = deque([executor.submit(scan_dir, folder_dir, file_type)])
+        while queue:
+            files, dirs = queue.popleft().result()
+            for dir_path in dirs:
+                queue.append(executor.submit(scan_dir, dir_path, file_type))
+            yield from files
+
+
+def read_manifest(manifest_path: str):
+    """
+    Reads a fairseq wav2vec2 manifest (.tsv) where the first line is the
+    root directory and every other line is a relative path followed by
+    a tab and the number of frames.
+
+    :params: [str] manifest_path - path to manifest tsv
+    :returns: [generator] full paths to audio files
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as tsv:
+        root = next(tsv).strip()
+        for line in tsv:
+            line = line.strip()
+            if line:
+                yield os.path.join(root, line.split('\t')[0])
+
+
+def read_file_list(list_path: str):
+    """
+    Reads a plain text file with one audio file path per line.
+
+    :params: [str] list_path - path to file list
+    :returns: [generator] paths to audio files
+    """
+    with open(list_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+class SNRSummary:
+    """
+    Mergeable, constant-memory summary of a stream of SNR values:
+    count/min/max/mean, a fixed-bin histogram and a quantile sketch.
+
+    The quantile sketch is a DDSketch-style log-bucket sketch: every value
+    is counted in a bucket whose width grows geometrically, so quantiles
+    are accurate to within relative_accuracy of the true value and the
+    number of buckets only depends on the range of the values. Two
+    summaries with the same settings can be merged by adding their
+    counts, so each worker can build its own and they are combined at
+    the end. NaN values (e.g. silent files) are only counted.
+    """
+
+    def __init__(self, hist_min: float = -10.0, hist_max: float = 40.0, hist_bins: int = 100,
+                 relative_accuracy: float = 0.01):
+        self.hist_min = hist_min
+        self.hist_max = hist_max
+        self.hist_bins = hist_bins
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.nan_count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.hist = [0] * hist_bins
+        self.underflow = 0
+        self.overflow = 0
+        self.zeros = 0
+        self.positive = Counter()
+        self.negative = Counter()
+
+    def empty_copy(self):
+        """
+        :returns: [SNRSummary] new, empty summary with the same settings
+        """
+        return SNRSummary(self.hist_min, self.hist_max, self.hist_bins, self.relative_accuracy)
+
+    def add(self, snr) -> None:
+        """
+        Adds one SNR to the summary. Multi-channel SNRs add one value
+        per channel.
+
+        :params: snr - SNR value (float or array of per-channel values)
+        """
+        for value in np.ravel(snr):
+            value = float(value)
+            if math.isnan(value):
+                self.nan_count += 1
+                continue
+            self.count += 1
+            self.total += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+            if value < self.hist_min:
+                self.underflow += 1
+            elif value >= self.hist_max:
+                self.overflow += 1
+            else:
+                width = (self.hist_max - self.hist_min) / self.hist_bins
+                self.hist[min(int((value - self.hist_min) / width), self.hist_bins - 1)] += 1
+            if abs(value) < 1e-12:
+                self.zeros += 1
+            elif value > 0:
+                self.positive[math.ceil(math.log(value) / self.log_gamma)] += 1
+            else:
+                self.negative[math.ceil(math.log(-value) / self.log_gamma)] += 1
+
+    def merge(self, other) -> None:
+        """
+        Merges another summary (built with the same settings) into this one.
+
+        :params: [SNRSummary] other - summary to merge in
+        """
+        if (other.hist_min, other.hist_max, other.hist_bins, other.relative_accuracy) != \
+                (self.hist_min, self.hist_max, self.hist_bins, self.relative_accuracy):
+            raise ValueError("Cannot merge SNR summaries with different settings.")
+        self.count += other.count
+        self.nan_count += other.nan_count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.hist = [a + b for a, b in zip(self.hist, other.hist)]
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.zeros += other.zeros
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+
+    def quantile(self, q: float):
+        """
+        :params: [float] q - quantile between 0 and 1 (0.95 == p95)
+        :returns: [float] estimated quantile (None if the summary is empty)
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = [(-self._bucket_value(k), c) for k, c in sorted(self.negative.items(), reverse=True)]
+        buckets.append((0.0, self.zeros))
+        buckets += [(self._bucket_value(k), c) for k, c in sorted(self.positive.items())]
+        for value, c in buckets:
+            seen += c
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def _bucket_value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        """
+        :returns: [dict] JSON-serializable report of the summary
+        """
+        width = (self.hist_max - self.hist_min) / self.hist_bins
+        return {
+            "count": self.count,
+            "nan_count": self.nan_count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "percentiles": {f"p{p}": self.quantile(p / 100) for p in (5, 25, 50, 75, 95)},
+            "histogram": {
+                "edges": [self.hist_min + i * width for i in range(self.hist_bins + 1)],
+                "counts": list(self.hist),
+                "underflow": self.underflow,
+                "overflow": self.overflow,
+            },
+            "relative_accuracy": self.relative_accuracy,
+        }
+
+
+def chunk_paths(paths, chunk_size: int):
+    """
+    Groups an iterable of paths into lists of at most chunk_size
+    paths so that each worker process gets a batch of files.
+
+    :params: paths - iterable of file paths, [int] chunk_size - max
+    number of paths per chunk
+    :returns: [generator] lists of paths
+    """
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def snr_chunk(paths: list, snr_fn=get_snr, summary: SNRSummary = None):
+    """
+    Worker function for the process pool. Computes the SNR of
+    every file in the chunk.
+
+    :params: [list] paths - paths to audio files, snr_fn - function
+    used to compute the SNR of one file (must be picklable), [SNRSummary]
+    summary - optional empty summary the worker fills for this chunk
+    :returns: [list] (path, SNR) pairs in the same order as paths and
+    the filled summary (or None)
+    """
+    pairs = [(path, snr_fn(path)) for path in paths]
+    if summary is not None:
+        for _, snr in pairs:
+            summary.add(snr)
+    return pairs, summary
+
+
+def iter_snrs(paths, workers: int = 1, chunk_size: int = 64, snr_fn=get_snr,
+              summary: SNRSummary = None):
+    """
+    Yields (path, SNR) pairs for every path. With more than one
+    worker the files are sent to a process pool in chunks, with at
+    most two chunks per worker in flight, and the chunks are released
+    in submission order so totals are summed in exactly the same order
+    as the serial path.
+
+    If a summary is given, each worker summarizes its own chunk and
+    the chunk summaries are merged into it as they finish.
+
+    :params: paths - iterable of file paths, [int] workers - number of
+    processes (1 = no pool), [int] chunk_size - files per task, snr_fn -
+    function used to compute the SNR of one file, [SNRSummary] summary -
+    optional summary updated with every SNR
+    :returns: [generator] (path, SNR) pairs
+    """
+    if workers <= 1:
+        for path in paths:
+            snr = snr_fn(path)
+            if summary is not None:
+                summary.add(snr)
+            yield path, snr
+        return
+    chunks = chunk_paths(paths, chunk_size)
+    in_flight = deque()
+
+    def submit(chunk):
+        in_flight.append(executor.submit(snr_chunk, chunk, snr_fn,
+                                         None if summary is None else summary.empty_copy()))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in islice(chunks, workers * 2):
+            submit(chunk)
+        while in_flight:
+            future = in_flight.popleft()
+            # Keep the pool busy while the oldest chunk is waited for
+            for chunk in islice(chunks, 1):
+                submit(chunk)
+            pairs, chunk_summary = future.result()
+            if summary is not None:
+                summary.merge(chunk_summary)
+            yield from pairs
+
+
+def open_snr_index(index_path: str) -> sqlite3.Connection:
+    """
+    Opens (or creates) the on-disk SNR index. Each row caches the SNR
+    of one file for one estimator along with the size and modification
+    time the file had when the SNR was computed.
+
+    :params: [str] index_path - path to SQLite database file
+    :returns: [sqlite3.Connection] open connection to the index
+    """
+    conn = sqlite3.connect(index_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS snr ("
+        "path TEXT NOT NULL, estimator TEXT NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, snr TEXT NOT NULL, PRIMARY KEY (path, estimator))"
+    )
+    return conn
+
+
+def estimator_name(snr_fn) -> str:
+    """
+    Builds the name under which SNRs from snr_fn are cached so that
+    values from different estimators (or settings) are never mixed.
+
+    :params: snr_fn - function (or functools.partial) computing one SNR
+    :returns: [str] estimator name, e.g. get_snr_streaming(block_size=1024)
+    """
+    func = getattr(snr_fn, 'func', snr_fn)
+    keywords = getattr(snr_fn, 'keywords', {})
+    settings = ",".join(f"{k}={getattr(v, '__name__', v)}" for k, v in sorted(keywords.items()))
+    return f"{func.__name__}({settings})"
+
+
+def hist_range(snr_fn) -> tuple:
+    """
+    :params: snr_fn - function (or functools.partial) computing one SNR
+    :returns: [tuple] default (hist_min, hist_max) of the report histogram
+    for the scale of snr_fn's values
+    """
+    func = getattr(snr_fn, 'func', snr_fn)
+    return HIST_RANGES['segmental' if func is get_segmental_snr else 'basic']
+
+
+def iter_snrs_indexed(paths, conn: sqlite3.Connection, workers: int = 1, chunk_size: int = 64,
+                      snr_fn=get_snr, commit_every: int = 1000, summary: SNRSummary = None):
+    """
+    Same as iter_snrs but backed by the SNR index. Files whose path,
+    size and mtime match an index row are read from the index, new or
+    changed files are computed (in the pool if workers > 1) and stored,
+    and once every path has been seen, rows for files that no longer
+    exist on disk are pruned. Pairs are yielded in discovery order
+    so the average matches an unindexed run exactly.
+
+    :params: paths - iterable of file paths, conn - open SNR index,
+    [int] workers - number of processes, [int] chunk_size - files per
+    task, snr_fn - function used to compute the SNR of one file,
+    [int] commit_every - number of new rows written per transaction,
+    [SNRSummary] summary - optional summary updated with every SNR
+    :returns: [generator] (path, SNR) pairs
+    """
+    estimator = estimator_name(snr_fn)
+    cached = {path: (size, mtime_ns, snr) for path, size, mtime_ns, snr in conn.execute(
+        "SELECT path, size, mtime_ns, snr FROM snr WHERE estimator = ?", (estimator,))}
+    ordered = []
+    stale = {}
+    found = set()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Let snr_fn report the missing file, but never cache it
+            ordered.append((path, None))
+            continue
+        found.add(path)
+        row = cached.get(path)
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            ordered.append((path, np.asarray(json.loads(row[2]))[()]))
+        else:
+            ordered.append((path, None))
+            stale[path] = (st.st_size, st.st_mtime_ns)
+    missing = [path for path, snr in ordered if snr is None]
+    if summary is not None:
+        for _, snr in ordered:
+            if snr is not None:
+                summary.add(snr)
+    computed = {}
+    pending = []
+    for path, snr in iter_snrs(missing, workers, chunk_size, snr_fn, summary):
+        computed[path] = snr
+        if path in stale:
+            size, mtime_ns = stale[path]
+            pending.append((path, estimator, size, mtime_ns, json.dumps(np.asarray(snr).tolist())))
+        if len(pending) >= commit_every:
+            conn.executemany("INSERT OR REPLACE INTO snr VALUES (?, ?, ?, ?, ?)", pending)
+            conn.commit()
+            pending = []
+    conn.executemany("INSERT OR REPLACE INTO snr VALUES (?, ?, ?, ?, ?)", pending)
+    # Prune files that were deleted since the last scan, including ones a
+    # manifest still lists. Rows outside this scan (another folder or
+    # manifest sharing the index) are kept while their file still exists.
+    deleted = [(estimator, path) for path in cached if path not in found and not os.path.exists(path)]
+    conn.executemany("DELETE FROM snr WHERE estimator = ? AND path = ?", deleted)
+    pruned = len(deleted)
+    conn.commit()
+    print(f"\nSNR index: {len(ordered) - len(missing)} cached, {len(missing)} computed, {pruned} pruned")
+    for path, snr in ordered:
+        yield path, (computed[path] if snr is None else snr)
+
+
+def get_average_snr(folder_dir: str, file_type: str, workers: int = 1, chunk_size: int = 64,
+                    snr_fn=get_snr, index_path: str = None, paths=None, discovery_workers: int = 0,
+                    summary: SNRSummary = None, report_path: str = None):
+    """
+    Iterates through all audio files that end with given
+    file type (default=wav), gets the SNR for each audio
+    file then prints the average SNR over all audio files.
+
+    :params: [str] folder_dir - path to file containing target
+    audio files, [str] file_type - type of audio file to search
+    for (wav, mp3, etc.), [int] workers - number of processes used
+    to compute SNRs, [int] chunk_size - files sent to a worker at a time,
+    snr_fn - function used to compute the SNR of one file, [str]
+    index_path - optional SQLite SNR index used to skip unchanged files,
+    paths - optional iterable of audio file paths (e.g. from read_manifest)
+    used instead of walking folder_dir, [int] discovery_workers - if > 0
+    folder_dir is listed in parallel with that many threads, [SNRSummary]
+    summary - summary to fill (if None, one with the histogram range of
+    snr_fn's estimator is used), [str]
+    report_path - optional path of a JSON report of the SNR distribution
+    :returns: Average SNR over audio files (None if no files were
+    processed). Also prints the average and p5/p50/p95.
+    """
+    if summary is None:
+        summary = SNRSummary(*hist_range(snr_fn))
+    total = 0
+    count = 0
+    if paths is None:
+        if discovery_workers > 0:
+            paths = find_audio_files_parallel(folder_dir, file_type, discovery_workers)
+        else:
+            paths = find_audio_files(folder_dir, file_type)
+    if index_path is None:
+        snrs = iter_snrs(paths, workers, chunk_size, snr_fn, summary)
+    else:
+        conn = open_snr_index(index_path)
+        snrs = iter_snrs_indexed(paths, conn, workers, chunk_size, snr_fn, summary=summary)
+    for _, snr in snrs:
+        total += snr
+        count += 1
+    if index_path is not None:
+        conn.close()
+    if report_path is not None:
+        report = {"folder": folder_dir, "estimator": estimator_name(snr_fn), **summary.to_dict()}
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nSNR report written to {report_path}")
+    try:
+        print(f"\nFolder: {folder_dir}")
+        print(f"\nAverage SNR:\n{total/count}dB")
+        print(f"\np5/p50/p95 SNR:\n{summary.quantile(0.05)} / {summary.quantile(0.5)} / {summary.quantile(0.95)}")
+        return total/count
+    except ZeroDivisionError:
+        print('ZeroDivisionError: Files not processed correctly. Check file format.')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path-to-audio-files", required=False, help='Path to individual audio files (MUST BE .wav) to be processed.')
+    parser.add_argument("--manifest", required=False, default=None, help='fairseq manifest (.tsv) listing the audio files. Skips the directory walk.')
+    parser.add_argument("--file-list", required=False, default=None, help='Text file with one audio file path per line. Skips the directory walk.')
+    parser.add_argument("--discovery-workers", required=False, default=0, type=int, help='List directories in parallel with this many threads (for network filesystems).')
+    parser.add_argument("--audio-file-type", required=False, default='wav', help='Type of audio file. Examples include: wav, mp3, etc.')
+    parser.add_argument("--workers", required=False, default=1, type=int, help='Number of processes used to compute SNRs (default=1 runs serially).')
+    parser.add_argument("--chunk-size", required=False, default=64, type=int, help='Number of files sent to a worker process at a time.')
+    parser.add_argument("--streaming", action='store_true', help='Memory-map each file and compute the SNR block by block (bounded memory for long recordings).')
+    parser.add_argument("--block-size", required=False, default=1 << 20, type=int, help='Number of frames per block in streaming mode.')
+    parser.add_argument("--float32", action='store_true', help='Use float32 for the per-block math in streaming mode.')
+    parser.add_argument("--estimator", required=False, default='basic', choices=['basic', 'segmental'], help='basic: mean/std of the squared normalized signal (default). segmental: frame-level segmental SNR in dB with energy-based VAD.')
+    parser.add_argument("--frame-ms", required=False, default=20, type=float, help='Frame length in milliseconds for the segmental estimator.')
+    parser.add_argument("--hop-ms", required=False, default=10, type=float, help='Frame hop in milliseconds for the segmental estimator.')
+    parser.add_argument("--vad-db", required=False, default=3, type=float, help='dB above the noise floor for a frame to count as speech (segmental estimator).')
+    parser.add_argument("--index", required=False, default=None, help='Path to SQLite SNR index. Unchanged files are read from it instead of recomputed.')
+    parser.add_argument("--report", required=False, default=None, help='Path of a JSON report with count/min/max, percentiles and a histogram of the SNRs.')
+    parser.add_argument("--hist-min", required=False, default=None, type=float, help='Lower edge of the SNR histogram (default: 0 for basic, -10 for segmental).')
+    parser.add_argument("--hist-max", required=False, default=None, type=float, help='Upper edge of the SNR histogram (default: 3 for basic, 40 for segmental).')
+    parser.add_argument("--hist-bins", required=False, default=100, type=int, help='Number of bins in the SNR histogram.')
+    args = parser.parse_args()
+    if args.path_to_audio_files is None and args.manifest is None and args.file_list is None:
+        parser.error("one of --path-to-audio-files, --manifest or --file-list is required")
+    print('\nFILE TYPE:', args.audio_file_type)
+    paths = None
+    folder = args.path_to_audio_files
+    if args.manifest is not None:
+        paths = read_manifest(args.manifest)
+        folder = args.manifest
+    elif args.file_list is not None:
+        paths = read_file_list(args.file_list)
+        folder = args.file_list
+    snr_fn = get_snr
+    if args.estimator == 'segmental':
+        snr_fn = partial(get_segmental_snr, frame_ms=args.frame_ms, hop_ms=args.hop_ms,
+                         vad_db=args.vad_db)
+    elif args.streaming:
+        snr_fn = partial(get_snr_streaming, block_size=args.block_size,
+                         dtype=np.float32 if args.float32 else np.float64)
+    hist_min, hist_max = hist_range(snr_fn)
+    if args.hist_min is not None:
+        hist_min = args.hist_min
+    if args.hist_max is not None:
+        hist_max = args.hist_max
+    summary = SNRSummary(hist_min, hist_max, args.hist_bins)
+    get_average_snr(folder, args.audio_file_type, args.workers, args.chunk_size, snr_fn,
+                    args.index, paths, args.discovery_workers, summary, args.report)
+
+if __name__ == "__main__":
+    main()
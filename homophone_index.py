@@ -0,0 +1,190 @@
+"""
+Purpose: Build and read a compact, offline homophone index for phoneticNoiser.py
+         so homophone swaps need no wordhoard/network lookups at noising time.
+         The index is a single sorted binary file that is memory-mapped
+         when loaded, so opening it takes milliseconds and lookups are a
+         binary search over the mapped file.
+
+         Parameters:
+            > --output : Path of the index file to write
+            > --groups : Text file of homophone groups, one group per line
+                         separated by commas or tabs (ex: sea,see,c)
+            > --vocab : Text file of transcripts; every word in it is looked
+                        up once with wordhoard and the results are stored
+
+Index file layout (little endian):
+    -> 8 byte magic b"PNHIDX01"
+    -> uint32 number of words N
+    -> (N + 1) uint64 offsets of each record in the data section
+    -> data section of records sorted by word: word\\0homophone\\0homophone...
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+
+MAGIC = b"PNHIDX01"
+HEADER = struct.Struct("<8sI")
+OFFSET = struct.Struct("<Q")
+ACCEPTABLE_WORD = re.compile(r"^[a-z]+$")
+
+
+def build_index(homophones: dict, index_path: str) -> None:
+    """
+    Writes a homophone index file.
+
+    :params: homophones - [dict] word -> iterable of homophones, index_path -
+    [str] path of the index file to write
+    :returns: None
+    """
+    records = []
+    for word in sorted(homophones, key=lambda w: w.encode("utf-8")):
+        others = sorted(set(h for h in homophones[word] if h and h != word))
+        if others:
+            records.append("\0".join([word] + others).encode("utf-8"))
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(records)))
+        for offset in offsets:
+            file.write(OFFSET.pack(offset))
+        for record in records:
+            file.write(record)
+    os.replace(tmp_path, index_path)
+
+
+class HomophoneIndex:
+    """
+    Read-only, memory-mapped view of an index written by build_index.
+    """
+
+    def __init__(self, index_path: str):
+        self.path = index_path
+        self._file = open(index_path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._file.close()
+            raise ValueError(f"{index_path} is not a homophone index.")
+        magic, self._count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} is not a homophone index.")
+        self._offsets_start = HEADER.size
+        self._data_start = self._offsets_start + (self._count + 1) * OFFSET.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _record(self, i: int) -> bytes:
+        start = OFFSET.unpack_from(self._mm, self._offsets_start + i * OFFSET.size)[0]
+        end = OFFSET.unpack_from(self._mm, self._offsets_start + (i + 1) * OFFSET.size)[0]
+        return self._mm[self._data_start + start:self._data_start + end]
+
+    def lookup(self, word: str) -> tuple:
+        """
+        Binary search for a word in the index.
+
+        :params: word - [str] word to look up
+        :returns: [tuple] homophones of the word (empty if there are none)
+        """
+        target = word.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            key = record.split(b"\0", 1)[0]
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                return tuple(h.decode("utf-8") for h in record.split(b"\0")[1:])
+        return ()
+
+
+def read_homophone_groups(groups_path: str) -> dict:
+    """
+    Reads homophone groups (one group per line, words separated by commas
+    or tabs). Every word in a group is a homophone of every other word.
+
+    :params: groups_path - [str] path to groups file
+    :returns: [dict] word -> set of homophones
+    """
+    homophones = {}
+    with open(groups_path, "r", encoding="utf-8") as file:
+        for line in file:
+            group = [w.strip() for w in re.split(r"[,\t]", line) if w.strip()]
+            for word in group:
+                homophones.setdefault(word, set()).update(w for w in group if w != word)
+    return homophones
+
+
+def wordhoard_homophones(word: str) -> list:
+    """
+    Looks up the homophones of a word with wordhoard (may use the network).
+
+    :params: word - [str] word to look up
+    :returns: [list] homophones of the word
+    """
+    from wordhoard import Homophones
+    possible_homophones = Homophones(word).find_homophones()
+    if possible_homophones is None or 'no homophones for' in possible_homophones:
+        return []
+    return [re.split(" is a homophone of ", x)[1] for x in possible_homophones]
+
+
+def read_vocabulary(path: str) -> set:
+    """
+    Collects every lowercase a-z word of a transcripts file.
+
+    :params: path - [str] path to transcripts txt file
+    :returns: [set] vocabulary
+    """
+    vocab = set()
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            vocab.update(w for w in line.split() if ACCEPTABLE_WORD.match(w))
+    return vocab
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", required=True, help="Path of the homophone index file to write")
+    parser.add_argument("--groups",                help="Text file of homophone groups (one group per line, comma or tab separated)")
+    parser.add_argument("--vocab",                 help="Transcripts txt file whose words are looked up with wordhoard")
+    args = parser.parse_args()
+    if args.groups is None and args.vocab is None:
+        parser.error("at least one of --groups or --vocab is required")
+
+    homophones = {}
+    if args.groups is not None:
+        homophones = read_homophone_groups(args.groups)
+    if args.vocab is not None:
+        vocab = sorted(read_vocabulary(args.vocab))
+        print(f"Looking up {len(vocab)} words with wordhoard...")
+        for word in vocab:
+            found = wordhoard_homophones(word)
+            if found:
+                homophones.setdefault(word, set()).update(found)
+    build_index(homophones, args.output)
+    with HomophoneIndex(args.output) as index:
+        print(f"Homophone index with {len(index)} words written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
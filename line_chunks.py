@@ -0,0 +1,42 @@
+"""
+Purpose: Splits text files into byte ranges that start and end on line
+         boundaries, so large files can be parsed or counted chunk by
+         chunk in worker processes (used by seq2seq_json_formatter.py and
+         ltr_counter.py).
+"""
+import os
+
+
+def line_boundary(opened, offset: int) -> int:
+    """
+    :returns: [int] offset of the first line that starts at or after
+    offset in a file opened in binary mode
+    """
+    if offset <= 0:
+        return 0
+    opened.seek(offset - 1)
+    opened.readline()
+    return opened.tell()
+
+
+def plan_chunks(files: list, chunk_bytes: int) -> list:
+    """
+    Splits text files into byte ranges that start and end on line
+    boundaries, in file order. A line is never split, so csv rows must
+    not contain quoted newlines (use chunk_bytes 0 to read each file whole).
+
+    :params: files - [list] text files, chunk_bytes - [int] approximate
+    chunk size (0 for one chunk per file)
+    :returns: [list] (file, start, end, first chunk of file) tuples
+    """
+    chunks = []
+    for file in files:
+        size = os.path.getsize(file)
+        if chunk_bytes <= 0 or size <= chunk_bytes:
+            chunks.append((file, 0, size, True))
+            continue
+        with open(file, 'rb') as opened:
+            bounds = sorted(set([line_boundary(opened, offset) for offset in range(0, size, chunk_bytes)] + [size]))
+        for start, end in zip(bounds, bounds[1:]):
+            chunks.append((file, start, end, start == 0))
+    return chunks
@@ -1,64 +1,201 @@
-"""
-Name: Riah Coulter
-Date: 6-22-21
-Purpose:
-    Create custom dict.ltr.txt which is a dictionary of all letter counts
-    for a given dataset prior wav2vec2 training/validation.
-
-
-Parameters:
--> directory of train.wrd and valid.wrd from modLibri_labels.py output
--> directory of output file to write to
-
-Output:
--> txt file with letter\scount pairs
-"""
-import argparse
-import pandas as pd
-import os
-import re
-import operator
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--train_dir", required=True)
-    parser.add_argument("--valid_dir", required=True)
-    parser.add_argument("--output_dir", required=True)
-    args = parser.parse_args()
-
-    os.makedirs(args.output_dir, exist_ok=True)
-
-    df1 = pd.read_csv(args.train_dir, header=None)
-    df2 = pd.read_csv(args.valid_dir, header=None)
-
-    df1.columns = ['raw']
-    df2.columns = ['raw']
-
-    df1 = df1.drop_duplicates('raw',keep='last')
-    df2 = df2.drop_duplicates('raw',keep='last')
-
-    sentence1 = df1['raw'].to_list()
-    sentence2 = df2['raw'].to_list()
-    sentence = sentence1 + sentence2
-    
-    letters = {}
-    for s in sentence:
-      # Replace whitespace with |
-      s = re.sub(" ", "|", s)
-      for letter in s:
-        if letter in letters:
-          letters[letter] += 1
-        else:
-          letters[letter] = 1
-
-    sorted_dict = sorted(letters.items(), key=operator.itemgetter(1), reverse=True)
-    assert len(sorted_dict) != 0, "Issue loading in data. Letter dictionary empty!"
-
-    file_to_save = f'{args.output_dir}/dict.ltr.txt'
-    file = open(file_to_save, 'w', encoding='utf-8')
-    for item in sorted_dict:
-      file.write(item[0] + " " + str(item[1]) + "\n")
-    file.close()
-
-if __name__ == "__main__":
-    main()
+"""
+Name: Riah Coulter
+Date: 6-22-21
+Purpose:
+    Create custom dict.ltr.txt which is a dictionary of all letter counts
+    for a given dataset prior wav2vec2 training/validation.
+
+
+Parameters:
+-> directory of train.wrd and valid.wrd from modLibri_labels.py output
+-> directory of output file to write to
+-> (optional) more text files to count (--input, repeatable)
+-> (optional) --all-lines to count every line instead of each distinct
+   sentence of a file once, with the number of worker processes and chunk
+   size in MB
+
+Output:
+-> txt file with letter\scount pairs (most frequent first, equal counts
+   in the order the letters were first seen)
+
+By default, as before, a sentence repeated within a file is counted once
+(the last copy is kept, like pandas drop_duplicates(keep='last')), in one
+streaming pass that keeps a hash of every distinct sentence of the current
+file. With --all-lines the input files are split into byte ranges that
+start and end on line boundaries and every range is counted in a worker
+process (bytes with numpy.bincount, only non-ASCII text is decoded and
+counted with Counter); the partial counts are merged at the end, so large
+corpora are counted at disk speed on all cores.
+"""
+import argparse
+import hashlib
+import os
+import operator
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from line_chunks import plan_chunks
+
+# Characters that separate sentences rather than belong to them
+LINE_BREAKS = ("\n", "\r")
+
+ASCII_RUNS = re.compile(r"[\x00-\x7f]+")
+
+
+def count_chunk(chunk: tuple) -> Counter:
+    """
+    Worker function: counts the characters of one byte range of a file.
+
+    :params: chunk - (path, start, end, first chunk of file) from plan_chunks
+    :returns: [Counter] character counts (line breaks excluded), in the
+    order the characters are first seen
+    """
+    path, start, end, _ = chunk
+    with open(path, 'rb') as opened:
+        opened.seek(start)
+        data = opened.read(end - start)
+    byte_counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    counts = Counter({chr(b): int(n) for b, n in enumerate(byte_counts[:128]) if n})
+    if byte_counts[128:].any():
+        # Multi-byte UTF-8 characters: count the decoded non-ASCII text
+        counts.update(ASCII_RUNS.sub("", data.decode('utf-8')))
+    for line_break in LINE_BREAKS:
+        counts.pop(line_break, None)
+    # Same order as counting character by character: first seen first
+    first_seen = sorted(counts, key=lambda letter: data.find(letter.encode('utf-8')))
+    return Counter({letter: counts[letter] for letter in first_seen})
+
+
+class UniqueSentenceLetters:
+    """
+    Letter counts of the distinct sentences of one or more files, the way
+    the original pandas script counted them: spaces are counted as '|',
+    a sentence repeated within a file is counted once, and letters are
+    listed in the order they are first seen once every file is reduced
+    to its distinct sentences in order of their last copy
+    (drop_duplicates(keep='last')), file after file.
+
+    The distinct sentences of the current file are kept as a hash plus the
+    string of their distinct letters, in a dict that moves a sentence to
+    the end whenever it is seen again.
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.order = {}
+        self.sentences = {}
+
+    def add(self, sentence: str) -> None:
+        if not sentence:
+            return
+        digest = hashlib.blake2b(sentence.encode('utf-8'), digest_size=8).digest()
+        sentence = sentence.replace(" ", "|")
+        letters = self.sentences.pop(digest, None)
+        if letters is None:
+            self.counts.update(sentence)
+            letters = "".join(dict.fromkeys(sentence))
+        self.sentences[digest] = letters
+
+    def end_file(self) -> None:
+        """
+        Closes the current file: a sentence repeated in a later file is
+        counted again.
+        """
+        for letters in self.sentences.values():
+            for letter in letters:
+                self.order.setdefault(letter, None)
+        self.sentences = {}
+
+    def letters(self) -> dict:
+        """
+        :returns: [dict] letter -> count, in the order first seen
+        """
+        self.end_file()
+        return {letter: self.counts[letter] for letter in self.order}
+
+
+def count_unique_sentences(paths: list) -> dict:
+    """
+    Counts the letters of every distinct sentence of each file once
+    (like the original drop_duplicates), with spaces counted as '|'.
+    Runs in one process.
+
+    :params: paths - list of text files
+    :returns: [dict] letter -> count, in the order first seen
+    """
+    unique = UniqueSentenceLetters()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                unique.add(line.rstrip("\r\n"))
+        unique.end_file()
+    return unique.letters()
+
+
+def count_letters(paths: list, workers: int = 1, chunk_bytes: int = 64*1024*1024) -> dict:
+    """
+    Counts the letters of every line of text files with spaces counted
+    as '|'.
+
+    :params: paths - list of text files, workers - processes counting
+    chunks, chunk_bytes - approximate chunk size
+    :returns: [dict] letter -> count, in the order first seen
+    """
+    chunks = plan_chunks(paths, chunk_bytes)
+    counts = Counter()
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(count_chunk, chunks):
+                counts.update(partial)
+    else:
+        for chunk in chunks:
+            counts.update(count_chunk(chunk))
+    return word_boundaries(counts)
+
+
+def word_boundaries(counts: Counter) -> dict:
+    """
+    :returns: [dict] counts with spaces counted as the '|' word boundary
+    """
+    letters = {}
+    for letter, count in counts.items():
+        letter = "|" if letter == " " else letter
+        letters[letter] = letters.get(letter, 0) + count
+    return letters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train_dir", help="Path to train.wrd")
+    parser.add_argument("--valid_dir", help="Path to valid.wrd")
+    parser.add_argument("--input", action="append", default=[], help="More text files to count (repeatable)")
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--all-lines", action="store_true", help="Count every line instead of each distinct sentence of a file once (chunked, parallel)")
+    parser.add_argument("--workers", default=os.cpu_count() or 1, type=int, help="Processes counting chunks with --all-lines")
+    parser.add_argument("--chunk-mb", default=64, type=float, help="Approximate size of the chunks each worker counts with --all-lines (0 counts files whole)")
+    args = parser.parse_args()
+
+    paths = [p for p in (args.train_dir, args.valid_dir) if p is not None] + args.input
+    if not paths:
+        parser.error("give at least one of --train_dir, --valid_dir or --input")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.all_lines:
+        letters = count_letters(paths, args.workers, int(args.chunk_mb * 1024 * 1024))
+    else:
+        letters = count_unique_sentences(paths)
+
+    # Most frequent first; the sort is stable, so equal counts stay in first seen order
+    sorted_dict = sorted(letters.items(), key=operator.itemgetter(1), reverse=True)
+    assert len(sorted_dict) != 0, "Issue loading in data. Letter dictionary empty!"
+
+    file_to_save = f'{args.output_dir}/dict.ltr.txt'
+    file = open(file_to_save, 'w', encoding='utf-8')
+    for item in sorted_dict:
+      file.write(item[0] + " " + str(item[1]) + "\n")
+    file.close()
+
+if __name__ == "__main__":
+    main()
@@ -15,65 +15,214 @@ Purpose:
   the future too.
 
   Parameters:
-  -> directory to training or validationt tsv
+  -> one or more training/validation/test tsvs (processed in a single run)
   -> and output directory to save the files to
-  -> an output name (such as 'train') for the files
+  -> (optional) comma separated output names (such as 'train,valid') for the
+     files; defaults to the tsv file names
+  -> (optional) --index-workers threads reading the .trans.txt files
+  -> (optional) --log-level (default WARNING; DEBUG shows every label)
+  -> (optional) --dict-ltr / --lexicon to also write dict.ltr.txt (same
+     counts and order as ltr_counter.py on the .wrd files, including its
+     --all-lines option) and lexicon.txt (same as wav2vec2_lexicon.py) from
+     the same pass, with --vocab-names choosing which outputs count towards them
 
   Update (7-1-21) added encoding=utf-8 to open files to prevent wrong encoding.
+
+  Every .trans.txt file under a tsv's root is read once up front (in parallel)
+  into an index shared by all tsvs with that root, and the .wrd/.ltr files are
+  written through large buffers.
 """
 import argparse
+import logging
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
+from ltr_counter import UniqueSentenceLetters
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("tsv")
-    parser.add_argument("--output-dir", required=True)
-    parser.add_argument("--output-name", required=True)
-    args = parser.parse_args()
+logger = logging.getLogger(__name__)
 
-    os.makedirs(args.output_dir, exist_ok=True)
+WRITE_BUFFER = 1 << 20
+
+
+def read_transcript(path: str) -> dict:
+    """
+    Reads one .trans.txt file (utterance id followed by its text per line).
+
+    :params: path - path to .trans.txt file
+    :returns: [dict] utterance id -> text
+    """
+    texts = {}
+    with open(path, "r", encoding="utf-8") as trans_f:
+        for tline in trans_f:
+            items = tline.strip().split()
+            if items:
+                texts[items[0]] = " ".join(items[1:])
+    return texts
+
+
+def index_transcripts(root: str, workers: int = 8) -> dict:
+    """
+    Finds and reads every .trans.txt file under root.
+
+    :params: root - audio root directory (first line of the tsv), workers -
+    threads reading transcript files
+    :returns: [dict] (directory relative to root, file name) -> transcript
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for filename in filenames:
+            if filename.endswith(".trans.txt"):
+                paths.append(("" if rel_dir == "." else rel_dir, filename))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        texts = executor.map(read_transcript, (os.path.join(root, d, f) for d, f in paths))
+        index = dict(zip(paths, texts))
+    logger.info(f"Indexed {len(index)} transcript files under {root}")
+    return index
+
+
+class VocabularyStats:
+    """
+    Letter counts and word list collected while the labels are written,
+    so dict.ltr.txt and lexicon.txt need no second pass over the text.
+    As in ltr_counter.py, a sentence repeated within one split is only
+    counted once and letters with equal counts are listed in the order
+    they were first seen (UniqueSentenceLetters, one split after the
+    other); with all_lines every sentence is counted (ltr_counter.py
+    --all-lines). Words are sorted, as in wav2vec2_lexicon.py.
+    """
+    def __init__(self, all_lines: bool = False):
+        self.all_lines = all_lines
+        self.counts = Counter()
+        self.unique = UniqueSentenceLetters()
+        self.split = None
+        self.words = set()
+
+    def add(self, text: str, split: str) -> None:
+        if self.all_lines:
+            self.counts.update(text.replace(" ", "|"))
+        else:
+            if split != self.split:
+                self.unique.end_file()
+                self.split = split
+            self.unique.add(text)
+        self.words.update(text.split())
+
+    @property
+    def letters(self) -> dict:
+        """
+        :returns: [dict] letter -> count, in the order first seen
+        """
+        if self.all_lines:
+            return dict(self.counts)
+        return self.unique.letters()
 
-    transcriptions = {}
+    def write_dict(self, path: str) -> None:
+        """
+        Writes dict.ltr.txt: "letter count" lines, most frequent first.
+        """
+        letters = self.letters
+        assert len(letters) != 0, "Issue loading in data. Letter dictionary empty!"
+        with open(path, "w", encoding="utf-8") as file:
+            # Stable sort: equal counts stay in first seen order
+            for letter, count in sorted(letters.items(), key=lambda item: item[1], reverse=True):
+                file.write(f"{letter} {count}\n")
 
-    with open(args.tsv, "r") as tsv, open(
-        os.path.join(args.output_dir, args.output_name + ".ltr"), "w", encoding="utf-8"
+    def write_lexicon(self, path: str) -> None:
+        """
+        Writes lexicon.txt: "word<tab> w o r d |" lines sorted by word.
+        """
+        with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as file:
+            for word in sorted(self.words):
+                file.write(word + "\t " + " ".join(word) + " |\n")
+
+
+def write_labels(tsv_path: str, output_dir: str, output_name: str, indexes: dict, workers: int = 8,
+                 vocab: VocabularyStats = None) -> int:
+    """
+    Writes the .wrd and .ltr files of one tsv.
+
+    :params: tsv_path - path to tsv, output_dir - directory to write to,
+    output_name - name of the .wrd/.ltr files, indexes - root ->
+    transcript index cache (filled in as needed), workers - threads
+    used when a new root has to be indexed, vocab - (optional)
+    VocabularyStats to add every label to
+    :returns: [int] number of labels written
+    """
+    count = 0
+    with open(tsv_path, "r", encoding="utf-8") as tsv, open(
+        os.path.join(output_dir, output_name + ".ltr"), "w", encoding="utf-8", buffering=WRITE_BUFFER
     ) as ltr_out, open(
-        os.path.join(args.output_dir, args.output_name + ".wrd"), "w", encoding="utf-8"
+        os.path.join(output_dir, output_name + ".wrd"), "w", encoding="utf-8", buffering=WRITE_BUFFER
     ) as wrd_out:
         root = next(tsv).strip()
-        
+        if root not in indexes:
+            indexes[root] = index_transcripts(root, workers)
+        index = indexes[root]
+
         for line in tsv:
             line = line.strip()
+            if not line:
+                continue
             dir = os.path.dirname(line)
-
-            if dir not in transcriptions:
-                parts = dir.split(os.path.sep)
-
-                trans_path = f"{parts[0]}.trans.txt"
-                print(f"trans_path: {trans_path}")
-                path = os.path.join(root, dir, trans_path)
-                print(f"path: {path}")
-                assert os.path.exists(path)
-                texts = {}
-                with open(path, "r") as trans_f:
-                    for tline in trans_f:
-                        items = tline.strip().split()
-                        print(f"items: {items}")
-                        texts[items[0]] = " ".join(items[1:])
-                print(f"dir: {dir}")
-                transcriptions[dir] = texts
-            print(f"line: {line}")
-            print(f"os.path.basename(line): {os.path.basename(line).split()}")
+            parts = dir.split(os.path.sep)
+            trans_path = f"{parts[0]}.trans.txt"
+            texts = index.get((dir, trans_path))
+            assert texts is not None, f"Missing transcript {os.path.join(root, dir, trans_path)}"
             part = os.path.basename(line).split()[0]
-            print(f"part: {part}")
-            print(f"transcriptions: {transcriptions}")
-            assert part in transcriptions[dir]
-            print(transcriptions[dir][part], file=wrd_out)
-            print(
-                " ".join(list(transcriptions[dir][part].replace(" ", "|"))) + " |",
-                file=ltr_out,
-            )
+            assert part in texts, f"{part} not found in {os.path.join(root, dir, trans_path)}"
+            text = texts[part]
+            logger.debug(f"{line}: {text}")
+            wrd_out.write(text + "\n")
+            ltr_out.write(" ".join(list(text.replace(" ", "|"))) + " |\n")
+            if vocab is not None:
+                vocab.add(text, output_name)
+            count += 1
+    logger.info(f"Wrote {count} labels for {tsv_path} to {output_name}.wrd/.ltr")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tsv", nargs="+", help="One or more manifest tsvs (e.g. train.tsv valid.tsv test.tsv)")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--output-name", default=None, help="Comma separated output names, one per tsv (default: tsv file names)")
+    parser.add_argument("--index-workers", default=8, type=int, help="Threads reading .trans.txt files")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    parser.add_argument("--dict-ltr", action="store_true", help="Also write dict.ltr.txt (letter counts) to the output dir")
+    parser.add_argument("--lexicon", action="store_true", help="Also write lexicon.txt to the output dir")
+    parser.add_argument("--all-lines", action="store_true", help="Count every sentence for --dict-ltr instead of each distinct sentence of a split once (as ltr_counter.py --all-lines)")
+    parser.add_argument("--vocab-names", default=None, help="Comma separated output names counted for --dict-ltr/--lexicon (default: all)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s: %(message)s")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.output_name is not None:
+        names = args.output_name.split(",")
+    else:
+        names = [os.path.splitext(os.path.basename(tsv))[0] for tsv in args.tsv]
+    if len(names) != len(args.tsv):
+        parser.error("--output-name needs one name per tsv")
+
+    vocab = None
+    vocab_names = set(names if args.vocab_names is None else args.vocab_names.split(","))
+    if args.dict_ltr or args.lexicon:
+        vocab = VocabularyStats(args.all_lines)
+
+    # Transcript indexes are shared between tsvs with the same root
+    indexes = {}
+    for tsv, name in zip(args.tsv, names):
+        count = write_labels(tsv, args.output_dir, name, indexes, args.index_workers,
+                             vocab if name in vocab_names else None)
+        print(f"{name}: {count} labels written")
+    if args.dict_ltr:
+        vocab.write_dict(os.path.join(args.output_dir, "dict.ltr.txt"))
+        print(f"dict.ltr.txt written with {len(vocab.letters)} letters")
+    if args.lexicon:
+        vocab.write_lexicon(os.path.join(args.output_dir, "lexicon.txt"))
+        print(f"lexicon.txt written with {len(vocab.words)} words")
 
 
 if __name__ == "__main__":
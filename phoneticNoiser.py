@@ -1,438 +1,1204 @@
-"""
-Author: Riah Coulter
-Date: 8-2-21
-Purpose: Take in ASR-generated transcripts and noise them phonetically
-         (mimicking the consequences of assimilation, insertion/deletion,
-         similary manner/place of articulation misidentification, etc.) so 
-         that a Grammar Error Checker (GEC) translation task can be conducted 
-         with the noised data for training.
-
-         Parameters:
-            > --path : Path to txt file containing transcripts
-            > --percent : Percent of data to be noised
-            > --outpath : Path to which to write noised/unnoised sentence pair csv
-            > --output-name : Name for new noised csv file
-
-Types of phonetic noising done by this script:
-    -> Assimilation (phonetically combining one word with neighbor)
-    -> Similar manner of articulation swap ('v' vs 'f')
-    -> Homophone swap ('sent' vs 'scent')
-
-
-Ideas for further development:
-    -> Give user control over noise-type weights
-"""
-from wordhoard import Homophones
-from tqdm import tqdm
-import argparse
-import random
-import time
-import nltk
-import csv
-import re
-import os
-
-# If set to true then more spelling errors per word will occur
-INTENSE_SPELLING = True
-
-# Variety of common spellings (English), whitespace insertions, manner of articulation
-MANNER_MAPPINGS = {
-	'a' : ['i','e','u','o'," "],
-	'b' : ['p','t','d','k','g'," "],
-	'c' : ['p','b','t','d','k','g','f','v','s','z','j','h'," "],
-	'd' : ['p','b','t','k','g'," "],
-	'e' : ['i','a'," "],
-	'f' : ['v','s','z','j','h'," "],
-	'g' : ['p','b','t','d','k'," "],
-	'h' : ['f','v','s','z','j'," "],
-	'i' : ['e','a'," "],
-	'j' : ['y','l','r','w','f','v','s','z','j','h'," "],
-	'k' : ['p','b','t','d','g'," "],
-	'l' : ['j','y','r','w'," "],
-	'm' : ['n'," "],
-	'n' : ['m'," "],
-	'o' : ['u','a'," "],
-	'p' : ['b','t','d','k','g'," "],
-	'q' : ['p','b','t','d','k','g'," "],
-	'r' : ['j','y','l','w'," "],
-	's' : ['f','v','z','j','h'," "],
-	't' : ['p','b','d','k','g'," "],
-	'u' : ['o','a'," "],
-	'v' : ['f','s','z','j','h'," "],
-	'w' : ['j','y','l','r'," "],
-	'x' : ['p','b','t','d','k','g','f','v','s','z','j','h'," "],
-	'y' : ['j','l','r','w'," "],
-	'z' : ['f','v','s','j','h'," "],
-	'bb': ['p','b','t','d','k','g'," "],
-    'ch': ['f','v','s','z','j','h'," "],
-	'dd': ['p','b','t','d','k','g'," "],
-	'ff': ['f','v','s','z','j','h'," "],
-	'ph': ['f','v','s','z','j','h'," "],
-	'gh': ['f','v','s','z','j','h'," "],
-	'lf': ['f','v','s','z','j','h'," "],
-	'ft': ['f','v','s','z','j','h'," "],
-	'wh': ['f','v','s','z','j','h'," "],
-	'dg': ['f','v','s','z','j','h'," "],
-	'gg': ['f','v','s','z','j','h'," "],
-	'cc': ['f','v','s','z','j','h','p','b','t','d','k','g'," "],
-    'ht': ['p','b','t','d','k','g'," "],
-	'll': ['j','y','l','r','w'," "],
-	'mm': ['m','n'," "],
-	'mb': ['m','n'," "],
-	'lm': ['m','n'," "],
-	'nn': ['m','n'," "],
-	'kn': ['m','n'," "],
-	'gn': ['m','n'," "],
-	'pn': ['m','n'," "],
-	'pp': ['p','b','t','d','k','g'," "],
-	'ph': ['f','v','s','z','j','h'," "],
-	'rr': ['j','y','l','r','w'," "],
-	'wr': ['j','y','l','r','w'," "],
-	'rh': ['j','y','l','r','w'," "],
-	'ss': ['f','v','s','z','j','h'," "],
-	'sc': ['f','v','s','z','j','h'," "],
-	'tt': ['p','b','t','d','k','g'," "],
-	'th': ['f','v','s','z','j','h'," "],
-	'zz': ['f','v','s','z','j','h'," "],
-    'ai': ['i','e','a'," "],
-    'ea': ['ay','ae','ei','eo','a'," "],
-    'ui': ['i'," "],
-    'oo': ['u','ou'," "],
-    'ou': ['u','oo'," "],
-    'eu': ['u', " "],
-	}
-
-def read_file(path: str) -> list:
-    try:
-        print("Attempting to read file...", end='')
-        file = open(path, 'r', encoding='utf-8')
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Directory not found: {path}")
-    else:
-        print("Success!")
-        lines = file.readlines()
-        file.close()
-        return lines
-
-def make_final(orig: list) -> None:
-    output = []
-    for i in range(len(orig)):
-        output.append("")
-    return output
-
-def zip_sentences(orig: list, final: list) -> str:
-    for i in range(len(final)):
-        if final[i] == "":
-            final[i] = orig[i]
-    final = re.sub("\s+", " ", " ".join(final))
-    return final
-
-def get_next_available(orig: list, cost: int) -> list:
-    if len("".join(orig)) == 0:
-        return []
-    else:
-        gap = cost - 1
-        random_indicies = random.sample(range(0,len(orig)),len(orig))
-        for i in random_indicies:
-            if cost > 1:
-                if i + gap < len(orig) and orig[i + gap] != "" and orig[i] != "":
-                    return [i,i+gap]
-                elif i - gap >= 0 and orig[i - gap] != "" and orig[i] != "":
-                    return [gap-i,i]
-            if cost == 1:
-                if orig[i] != "":
-                    return [i]
-        return []
-
-def manner_swap(orig: list, final: list):
-    """
-    Swap two sounds that have similar manner of articulation.
-
-    :params: A list of the original words and a list of the
-    final words in process
-    :returns: The updated original list and final list plus
-    a Boolean where if orig and final lists were updated is
-    equal to True, otherwise False
-    """
-    cost = 1
-    index = get_next_available(orig, cost)
-    if len(index) == 1:
-        word= orig[index[0]]
-        # two,too,to is an issue, so capture that here
-        ttt = ['two','too','to']
-        if word in ttt:
-            # Only get a 'two' other than the one found
-            ttt.remove(word)
-            random_index0 = random.randint(0, len(ttt)-1)
-            new_word = ttt[random_index0]
-            # swap
-            orig[index[0]] = ""
-            final[index[0]] = new_word
-            return orig, final, True
-        elif len(word) == 1:
-            # Handle words of length one such as 'a' or 'I' or abbreviations
-            if word in MANNER_MAPPINGS:
-                random_index1 = random.randint(0,len(MANNER_MAPPINGS[word])-1)
-                new_word  = MANNER_MAPPINGS[word][random_index1]
-                # swap
-                orig[index[0]] = ""
-                final[index[0]] = new_word
-                return orig, final, True
-            else:
-                # Single word not in articulation dictionary
-                return orig, final, False
-        else:
-            wordBigrams  = [[x[0],x[1]] for x in nltk.bigrams(word)]
-            random_index2 = random.randint(0, len(wordBigrams)-1)
-            # Get random individual sounds
-            pair = wordBigrams[random_index2]
-            # Also get them together in case that makes more sense('sh', 'ss', 'rr', etc.)
-            combo = "".join(pair)
-            if combo in MANNER_MAPPINGS:
-                random_index3 = random.randint(0,len(MANNER_MAPPINGS[combo])-1)
-                new_letters = MANNER_MAPPINGS[combo][random_index3]
-                wordBigrams[random_index2] = ["", new_letters]
-                if len(new_letters) == 2:
-                    new_word = wordBigrams[0][0] + "".join([x[1] for x in wordBigrams[1:]])
-                else:
-                    new_word = wordBigrams[0][0] + "".join([x[1] for x in wordBigrams])
-                # swap
-                orig[index[0]] = ""
-                final[index[0]] = new_word
-                return orig,final, True
-            else:
-                letter = pair[1]
-                if letter in MANNER_MAPPINGS:
-                    random_index5 = random.randint(0,len(MANNER_MAPPINGS[letter])-1)
-                    new_letter = MANNER_MAPPINGS[letter][random_index5]
-                    pair[1] = new_letter
-                    wordBigrams[random_index2] = pair
-                    new_word = wordBigrams[0][0] + "".join([x[1] for x in wordBigrams])
-                    # swap
-                    orig[index[0]] = ""
-                    final[index[0]] = new_word
-                    return orig, final,True
-                else:
-                    return orig, final, False
-    else: return orig, final, False
-
-
-
-def find_homophone(orig: list, final: list):
-    """
-    Swap a word with it's homophone if it exists.
-
-    :params: A list of the original words and a list of the
-    final words in process
-    :returns: The updated original list and final list plus
-    a Boolean where if orig and final lists were updated is
-    equal to True, otherwise False
-    """
-    acceptable_characters = {'a','b','c','d','e','f','g','h','i','j','k','l','m','n','o','p','q','r','s','t','u','v','w','x','y','z'}
-    cost = 1
-    index = get_next_available(orig, cost)
-    if len(index) == 1:
-        word = orig[index[0]]
-        # if contains unusual characters, try a different method
-        if len(set(word.strip()).difference(acceptable_characters)) > 0:
-            return orig, final, False
-        word = Homophones(word)
-        # Find all possible homophones for given word
-        possible_homophones = word.find_homophones()
-        if possible_homophones is not None and 'no homophones for' not in possible_homophones and len(possible_homophones) != 0:
-            results = [re.split(" is a homophone of ", x)[1] for x in possible_homophones]
-            # Randomly select one of the homophones for swapping
-            rand_index = random.randint(0,len(results)-1)
-            homophone = results[rand_index]
-            # Swap
-            final[index[0]] = homophone
-            orig[index[0]] = ""
-            return orig, final, True
-        else:
-			# No available word homophone for homophone swapping (aka swap unsuccessful)
-            return orig, final, False
-    else:
-        # No available word in orig for homophone swapping (aka swap unsuccessful)
-        return orig, final, False
-
-def assimilation(orig: list, final: list):
-    """
-    Cheap version of assimilation. Assimilate two words
-    together by removing the first sound of the second
-    word then creating a new word by merging the first
-    word and second edited word together.
-
-    :params: A list of the original words and a list of the
-    final words in process
-    :returns: The updated original list and final list plus
-    a Boolean where if orig and final lists were updated is
-    equal to True, otherwise False
-    """
-    cost = 2
-    indexes = get_next_available(orig, cost)
-    if len(indexes) == 2:
-        word1 = orig[indexes[0]]
-        word2 = orig[indexes[1]]
-        # Merge together
-        word3 = word1[:-1] + word2
-        # Replace slot in final
-        final[indexes[0]] = word3
-        # Replace original with "" in orig
-        orig[indexes[0]] = ""
-        orig[indexes[1]] = ""
-        return orig, final, True
-    else:
-        # Did not do assimilation successfully since 
-        # not 2 consecutive words available in orig
-        return orig, final, False
-
-def do_noising(orig, final, nType):
-    """
-    Noising Control.
-
-    :params: A list of the original words and a list of the
-    final words in process
-    :returns: Return result of noising if successful, or
-    return original and final lists unaltered with a False
-    boolean if noising type is not listed in the conditional
-    options.
-    """
-    if nType == "assimilation":
-        return assimilation(orig, final)
-    elif nType == "homophone":
-        return find_homophone(orig, final)
-    elif nType == "manner":
-        return manner_swap(orig, final)
-    else:
-        return orig, final, False
-
-
-def noise(limit: int, orig: list, final: list, guidebook: dict) -> str:
-    """
-    Core noising function. Uses recursion to continually noise the given
-    sentence until the limit is reduced to zero. Each noising action has
-    an associated cost that is subtracted from the limit if successful.
-    We know if noising is successful based on the Boolean value returned
-    by each individual noising function.
-
-    :params: limit - how many noising operations to perform, orig - the
-    original sentence, final - an array of empty strings the same size as
-    the orig list, guidebook - a dictionary of noising types and their costs
-    :returns: The zipped lists of the original sentence (which should be
-    full of empty strings if noising went well) and the newly noised
-    sentence
-    """
-    if limit <= 0:
-        return zip_sentences(orig, final)
-    else:
-        # Randomly get type of noising from options so that there is
-        # no noising bias
-        noise_type, cost = random.choice(list(guidebook.items()))
-        if (limit - cost) >= 0:
-            orig, final, status = do_noising(orig, final, noise_type)
-            # Status makes sure the noising was successful; if it wasn't this
-            # allows the sentence to be noised in some other way and thus keeps the
-            # percent noised accurate
-            if status is True:
-                #print(f"Type {noise_type} imposed on sentence.")
-                limit = limit - cost
-            return noise(limit, orig, final, guidebook)
-        else:
-            return noise(limit, orig, final, guidebook)
-
-
-def control(lines: list, percent: float, guidebook: dict):
-    """
-    Reads in sentences, performs noising on each sentence according
-    to the noising percentage given.
-
-    :params: lines - list of all sentences, percent - float of percent
-    to be noised per sentence, guidebook - a dictionary of noising types
-    and their costs
-    """
-    orig_noised = []
-    start = time.time()
-    count = 0
-    for line in tqdm(lines):
-        line = re.sub(r'\s+', ' ', line).rstrip()
-        # do not include empty lines (\n, \t, '', \s, etc)
-        if len(re.findall(r'^[\n\s\t]*$', line)) != 0:
-            continue
-        # tokenize
-        orig = line.split(" ")
-        # get limit
-        limit = float(round(percent*len(orig)))
-        # get final list
-        final = make_final(orig)
-        if limit < 1:
-            # Too small to do more than one noising action
-            small_orig, small_final, boolean = manner_swap(orig, final)
-            if boolean:
-                noised_sent = zip_sentences(small_orig, small_final)
-            else:
-                # Too small to be noised so in this case
-                # orig == noised_orig
-                noised_sent = orig
-        else:
-            # normal noise
-            noised_sent = noise(limit, orig, final, guidebook)
-        # add as tuple to noised (they are strings again at this point)
-        orig_noised.append([noised_sent, line.rstrip()])
-        #print(f"ORIG: {line}\nNOISED: {noised_sent}")
-        count += 1
-    print(f"Total time noising: {time.time() - start}")
-    print(f"Total sentences noised: {count}")
-    return orig_noised
-
-def to_csv(sentences: list, output_path: str, file_name: str) -> None:
-    """
-    Takes a list of noised and clean sentences and writes them to
-    a csv file.
-
-    :params: sentences - list of all sentences, output_path - directory
-    to which the csv file will be written, file_name - name of file to
-    be written
-    :returns: None
-    """
-    path      = os.path.join(output_path, file_name)
-    # open file to write 
-    file      = open(path, "w", encoding="utf-8", newline='')
-    # create instance of csv writer
-    writer    = csv.writer(file)
-    # headers
-    headers = ['befr', 'en']
-    # write headers first
-    writer.writerow(headers)
-    # write data to file
-    writer.writerows(sentences)
-    print(f"Noised data writtent to CSV file at {path}")
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--path",         required=True,   help="Path to txt file containing transcripts")
-    parser.add_argument("--percent",      required=True,   help="Percent of data to be noised")
-    parser.add_argument("--outpath",      required=True,   help="Path to which to write noised/unnoised sentence pair csv")
-    parser.add_argument("--output-name",  required=True,   help="Name for new noised csv file")
-    args = parser.parse_args()
-    
-    file_lines   = read_file(args.path)
-
-    # Weights for each noising type
-    guidelines = {
-                'assimilation' : 2.0,
-                'homophone'    : 1.0,
-                'manner'       : 0.5,
-            }
-
-    output  = control(file_lines, float(args.percent), guidelines)
-    outPath = os.path.join(args.outpath,"")
-    name    = f"NOISED-{args.percent}_{args.output_name}.csv"
-    to_csv(output, outPath, name)
-
-
-if __name__ == "__main__":
-    main()
-
-
-
+"""
+Author: Riah Coulter
+Date: 8-2-21
+Purpose: Take in ASR-generated transcripts and noise them phonetically
+         (mimicking the consequences of assimilation, insertion/deletion,
+         similary manner/place of articulation misidentification, etc.) so 
+         that a Grammar Error Checker (GEC) translation task can be conducted 
+         with the noised data for training.
+
+         Parameters:
+            > --path : Path to txt file containing transcripts
+            > --percent : Percent of data to be noised (comma separated list
+                          for several noise levels in one run)
+            > --variants : (Optional) noised copies of every sentence per percent
+            > --outpath : Path to which to write noised/unnoised sentence pair csv
+            > --output-name : Name for new noised csv file
+            > --homophone-index : (Optional) offline homophone index built with
+                                  homophone_index.py; no wordhoard/network
+                                  lookups are made when it is given
+            > --workers : (Optional) number of processes to noise with
+            > --seed : (Optional) seed; each line is noised with a generator
+                       seeded from (seed, line index), so output does not
+                       depend on --workers
+            > --stream : (Optional) read, noise and write in batches of --batch-size
+                         lines with a resumable --checkpoint (constant memory)
+            > --stats : (Optional) JSON file for per noise type attempts,
+                        successes, failures by reason and time spent
+
+Types of phonetic noising done by this script:
+    -> Assimilation (phonetically combining one word with neighbor)
+    -> Similar manner of articulation swap ('v' vs 'f')
+    -> Homophone swap ('sent' vs 'scent')
+
+
+Ideas for further development:
+    -> Give user control over noise-type weights
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from tqdm import tqdm
+import argparse
+import random
+import time
+import bisect
+import itertools
+import json
+import csv
+import io
+import re
+import os
+
+from homophone_index import HomophoneIndex
+
+try:
+    from wordhoard import Homophones
+except ImportError:
+    # Only needed when no offline homophone index is loaded
+    Homophones = None
+
+try:
+    from torch.utils.data import IterableDataset, get_worker_info
+except ImportError:
+    # Only needed for NoisedDataset inside a torch DataLoader
+    IterableDataset = object
+    get_worker_info = None
+
+# If set to true then more spelling errors per word will occur
+INTENSE_SPELLING = True
+
+# Cap on noising attempts per sentence (successful or not) so sentences
+# that cannot reach their limit still finish
+MAX_ATTEMPTS_PER_WORD = 10
+MIN_ATTEMPTS = 100
+
+# Offline homophone index (see load_homophone_index). When None, wordhoard is used.
+HOMOPHONE_INDEX = None
+
+# Noising counters and timers (see enable_stats). When None nothing is recorded.
+NOISE_STATS = None
+
+# Cost of each noising type (subtracted from a sentence's limit when it succeeds)
+DEFAULT_GUIDEBOOK = {
+            'assimilation' : 2.0,
+            'homophone'    : 1.0,
+            'manner'       : 0.5,
+        }
+
+# Variety of common spellings (English), whitespace insertions, manner of articulation
+MANNER_MAPPINGS = {
+	'a' : ['i','e','u','o'," "],
+	'b' : ['p','t','d','k','g'," "],
+	'c' : ['p','b','t','d','k','g','f','v','s','z','j','h'," "],
+	'd' : ['p','b','t','k','g'," "],
+	'e' : ['i','a'," "],
+	'f' : ['v','s','z','j','h'," "],
+	'g' : ['p','b','t','d','k'," "],
+	'h' : ['f','v','s','z','j'," "],
+	'i' : ['e','a'," "],
+	'j' : ['y','l','r','w','f','v','s','z','j','h'," "],
+	'k' : ['p','b','t','d','g'," "],
+	'l' : ['j','y','r','w'," "],
+	'm' : ['n'," "],
+	'n' : ['m'," "],
+	'o' : ['u','a'," "],
+	'p' : ['b','t','d','k','g'," "],
+	'q' : ['p','b','t','d','k','g'," "],
+	'r' : ['j','y','l','w'," "],
+	's' : ['f','v','z','j','h'," "],
+	't' : ['p','b','d','k','g'," "],
+	'u' : ['o','a'," "],
+	'v' : ['f','s','z','j','h'," "],
+	'w' : ['j','y','l','r'," "],
+	'x' : ['p','b','t','d','k','g','f','v','s','z','j','h'," "],
+	'y' : ['j','l','r','w'," "],
+	'z' : ['f','v','s','j','h'," "],
+	'bb': ['p','b','t','d','k','g'," "],
+    'ch': ['f','v','s','z','j','h'," "],
+	'dd': ['p','b','t','d','k','g'," "],
+	'ff': ['f','v','s','z','j','h'," "],
+	'ph': ['f','v','s','z','j','h'," "],
+	'gh': ['f','v','s','z','j','h'," "],
+	'lf': ['f','v','s','z','j','h'," "],
+	'ft': ['f','v','s','z','j','h'," "],
+	'wh': ['f','v','s','z','j','h'," "],
+	'dg': ['f','v','s','z','j','h'," "],
+	'gg': ['f','v','s','z','j','h'," "],
+	'cc': ['f','v','s','z','j','h','p','b','t','d','k','g'," "],
+    'ht': ['p','b','t','d','k','g'," "],
+	'll': ['j','y','l','r','w'," "],
+	'mm': ['m','n'," "],
+	'mb': ['m','n'," "],
+	'lm': ['m','n'," "],
+	'nn': ['m','n'," "],
+	'kn': ['m','n'," "],
+	'gn': ['m','n'," "],
+	'pn': ['m','n'," "],
+	'pp': ['p','b','t','d','k','g'," "],
+	'ph': ['f','v','s','z','j','h'," "],
+	'rr': ['j','y','l','r','w'," "],
+	'wr': ['j','y','l','r','w'," "],
+	'rh': ['j','y','l','r','w'," "],
+	'ss': ['f','v','s','z','j','h'," "],
+	'sc': ['f','v','s','z','j','h'," "],
+	'tt': ['p','b','t','d','k','g'," "],
+	'th': ['f','v','s','z','j','h'," "],
+	'zz': ['f','v','s','z','j','h'," "],
+    'ai': ['i','e','a'," "],
+    'ea': ['ay','ae','ei','eo','a'," "],
+    'ui': ['i'," "],
+    'oo': ['u','ou'," "],
+    'ou': ['u','oo'," "],
+    'eu': ['u', " "],
+	}
+
+def read_file(path: str) -> list:
+    try:
+        print("Attempting to read file...", end='')
+        file = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Directory not found: {path}")
+    else:
+        print("Success!")
+        lines = file.readlines()
+        file.close()
+        return lines
+
+def make_final(orig: list) -> None:
+    output = []
+    for i in range(len(orig)):
+        output.append("")
+    return output
+
+def zip_sentences(orig: list, final: list) -> str:
+    for i in range(len(final)):
+        if final[i] == "":
+            final[i] = orig[i]
+    final = re.sub("\s+", " ", " ".join(final))
+    return final
+
+class IndexedSet:
+    """
+    Set of slot indices that supports O(1) add, discard and uniform
+    random choice (a list of items plus a map from item to its position).
+    """
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is not None:
+            last = self.items.pop()
+            if position < len(self.items):
+                # Move the last item into the freed position
+                self.items[position] = last
+                self.positions[last] = position
+
+    def choice(self, rng=random):
+        return self.items[rng.randrange(len(self.items))]
+
+
+class FreeSlots:
+    """
+    Tracks which words in orig are still available for noising so a
+    noising operation can pick its slot in O(1) instead of scanning
+    the sentence. singles holds every free word; pairs holds every free
+    word that has a free neighbour (the words assimilation can start from).
+    """
+    def __init__(self, orig: list):
+        self.free = [word != "" for word in orig]
+        self.singles = IndexedSet(i for i, free in enumerate(self.free) if free)
+        self.pairs = IndexedSet(i for i in self.singles.items if self.has_pair(i))
+
+    def is_free(self, i: int) -> bool:
+        return 0 <= i < len(self.free) and self.free[i]
+
+    def has_pair(self, i: int) -> bool:
+        return self.is_free(i) and (self.is_free(i + 1) or self.is_free(i - 1))
+
+    def take(self, i: int) -> None:
+        """
+        Marks slot i as used and updates the pair candidates around it.
+        """
+        self.free[i] = False
+        self.singles.discard(i)
+        for j in (i - 1, i, i + 1):
+            if self.has_pair(j):
+                self.pairs.add(j)
+            else:
+                self.pairs.discard(j)
+
+    def choose(self, cost: int, rng=random) -> list:
+        """
+        Picks a random free slot (cost 1) or pair of adjacent free slots
+        (cost 2). Same distribution as scanning a random permutation of
+        the sentence for the first usable index.
+
+        :returns: [list] chosen indices, empty if nothing is available
+        """
+        if cost == 1:
+            return [self.singles.choice(rng)] if len(self.singles) else []
+        if not len(self.pairs):
+            return []
+        i = self.pairs.choice(rng)
+        return [i, i + 1] if self.is_free(i + 1) else [i - 1, i]
+
+
+class NoiseStats:
+    """
+    Counters and timers for noising: per noise type the attempts,
+    successes, failures by reason, attempts skipped because the type
+    cost more than the sentence had left, and seconds spent; per run the
+    sentences and words noised and the sentences that ran out of attempts.
+    Stats from worker processes are combined with merge.
+    """
+    def __init__(self):
+        self.sentences = 0
+        self.words = 0
+        self.capped = 0
+        self.noising_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.types = {}
+
+    def _type(self, noise_type: str) -> dict:
+        if noise_type not in self.types:
+            self.types[noise_type] = {"attempts": 0, "successes": 0, "skipped_over_limit": 0,
+                                      "seconds": 0.0, "failures": {}}
+        return self.types[noise_type]
+
+    def attempt(self, noise_type: str, success: bool, seconds: float) -> None:
+        counts = self._type(noise_type)
+        counts["attempts"] += 1
+        counts["successes"] += int(success)
+        counts["seconds"] += seconds
+
+    def fail(self, noise_type: str, reason: str) -> None:
+        failures = self._type(noise_type)["failures"]
+        failures[reason] = failures.get(reason, 0) + 1
+
+    def skip(self, noise_type: str) -> None:
+        self._type(noise_type)["skipped_over_limit"] += 1
+
+    def merge(self, other: "NoiseStats") -> None:
+        self.sentences += other.sentences
+        self.words += other.words
+        self.capped += other.capped
+        self.noising_seconds += other.noising_seconds
+        for noise_type, theirs in other.types.items():
+            ours = self._type(noise_type)
+            for key in ("attempts", "successes", "skipped_over_limit", "seconds"):
+                ours[key] += theirs[key]
+            for reason, count in theirs["failures"].items():
+                ours["failures"][reason] = ours["failures"].get(reason, 0) + count
+
+    def to_dict(self) -> dict:
+        """
+        :returns: [dict] json-serializable report; sentences_per_sec uses
+        wall clock time when the caller set it, else time spent noising
+        """
+        seconds = self.wall_seconds or self.noising_seconds
+        return {
+            "sentences": self.sentences,
+            "words": self.words,
+            "sentences_out_of_attempts": self.capped,
+            "noising_seconds": self.noising_seconds,
+            "wall_seconds": self.wall_seconds,
+            "sentences_per_sec": self.sentences / seconds if seconds > 0 else None,
+            "words_per_sec": self.words / seconds if seconds > 0 else None,
+            "types": {noise_type: dict(counts, success_rate=counts["successes"] / counts["attempts"]
+                                       if counts["attempts"] else None)
+                      for noise_type, counts in sorted(self.types.items())},
+        }
+
+    def report(self) -> str:
+        stats = self.to_dict()
+        lines = [f"Sentences: {stats['sentences']} ({stats['sentences_per_sec'] or 0:.1f}/sec), "
+                 f"out of attempts: {stats['sentences_out_of_attempts']}"]
+        for noise_type, counts in stats["types"].items():
+            failures = ", ".join(f"{reason}={count}" for reason, count in sorted(counts["failures"].items()))
+            lines.append(f"  {noise_type:<13} attempts={counts['attempts']} successes={counts['successes']} "
+                         f"skipped_over_limit={counts['skipped_over_limit']} seconds={counts['seconds']:.3f}"
+                         + (f" failures: {failures}" if failures else ""))
+        return "\n".join(lines)
+
+
+def enable_stats() -> NoiseStats:
+    """
+    Starts recording noising stats in this process.
+
+    :returns: [NoiseStats] the (new) recorder
+    """
+    global NOISE_STATS
+    NOISE_STATS = NoiseStats()
+    return NOISE_STATS
+
+
+def note_failure(noise_type: str, reason: str) -> None:
+    """
+    Records why a noising attempt failed (no-op unless stats are enabled).
+    """
+    if NOISE_STATS is not None:
+        NOISE_STATS.fail(noise_type, reason)
+
+
+def bigram_swap(word: str, position: int, new_letters: str, whole_bigram: bool) -> str:
+    """
+    Builds the word produced by swapping the bigram at position (or only
+    its second letter when whole_bigram is False) with new_letters,
+    exactly as the original bigram-list based manner swap did.
+    """
+    wordBigrams = [[word[k], word[k + 1]] for k in range(len(word) - 1)]
+    if whole_bigram:
+        wordBigrams[position] = ["", new_letters]
+        if len(new_letters) == 2:
+            return wordBigrams[0][0] + "".join([x[1] for x in wordBigrams[1:]])
+        return wordBigrams[0][0] + "".join([x[1] for x in wordBigrams])
+    wordBigrams[position][1] = new_letters
+    return wordBigrams[0][0] + "".join([x[1] for x in wordBigrams])
+
+
+@lru_cache(maxsize=1 << 17)
+def manner_table(word: str) -> tuple:
+    """
+    Compiles MANNER_MAPPINGS against one word into a flat candidate
+    table: every word a manner swap can produce, with the cumulative
+    probability of producing it. A None outcome holds the probability
+    that the swap fails (picked sound has no mapping). The table is built
+    once per word and cached, so sampling is a lookup plus one RNG draw.
+
+    Sampling probabilities match the original procedure: for 'two',
+    'too' and 'to' one of the other two; for one-letter words one of
+    its mappings; otherwise a uniformly random bigram, whose mapping is
+    used if it has one, else the mapping of its second letter.
+
+    :params: word - word to compile
+    :returns: [tuple] (cumulative probabilities, outcomes)
+    """
+    outcomes = []
+    # two,too,to is an issue, so capture that here
+    ttt = ['two','too','to']
+    if word in ttt:
+        # Only get a 'two' other than the one found
+        ttt.remove(word)
+        outcomes = [(1 / len(ttt), w) for w in ttt]
+    elif len(word) == 1:
+        # Handle words of length one such as 'a' or 'I' or abbreviations
+        candidates = MANNER_MAPPINGS.get(word, [])
+        outcomes = [(1 / len(candidates), c) for c in candidates]
+    elif len(word) > 1:
+        positions = len(word) - 1
+        for position in range(positions):
+            # Also get them together in case that makes more sense('sh', 'ss', 'rr', etc.)
+            combo = word[position:position + 2]
+            letter = word[position + 1]
+            if combo in MANNER_MAPPINGS:
+                candidates = MANNER_MAPPINGS[combo]
+                outcomes += [(1 / positions / len(candidates), bigram_swap(word, position, c, True))
+                             for c in candidates]
+            elif letter in MANNER_MAPPINGS:
+                candidates = MANNER_MAPPINGS[letter]
+                outcomes += [(1 / positions / len(candidates), bigram_swap(word, position, c, False))
+                             for c in candidates]
+            else:
+                outcomes.append((1 / positions, None))
+    if not outcomes:
+        return (1.0,), (None,)
+    cumulative = list(itertools.accumulate(p for p, _ in outcomes))
+    cumulative[-1] = 1.0
+    return tuple(cumulative), tuple(w for _, w in outcomes)
+
+
+def compile_manner_tables(vocabulary) -> None:
+    """
+    Precompiles the manner swap tables for every word of a vocabulary.
+
+    :params: vocabulary - iterable of words
+    :returns: None
+    """
+    for word in vocabulary:
+        manner_table(word)
+
+
+def manner_variant(word: str, rng=random):
+    """
+    Swaps one sound of a word with a sound of similar manner of articulation.
+
+    :params: word - word to change, rng - random number generator
+    :returns: [str] the changed word, or None if no swap is possible
+    """
+    cumulative, outcomes = manner_table(word)
+    return outcomes[bisect.bisect_right(cumulative, rng.random())]
+
+def manner_swap(orig: list, final: list, slots: FreeSlots = None, rng=random):
+    """
+    Swap two sounds that have similar manner of articulation.
+
+    :params: A list of the original words and a list of the
+    final words in process, slots - FreeSlots tracker for orig
+    (built if not given), rng - random number generator
+    :returns: The updated original list and final list plus
+    a Boolean where if orig and final lists were updated is
+    equal to True, otherwise False
+    """
+    cost = 1
+    if slots is None:
+        slots = FreeSlots(orig)
+    index = slots.choose(cost, rng)
+    if len(index) == 1:
+        new_word = manner_variant(orig[index[0]], rng)
+        if new_word is None:
+            # Picked sound has no manner mapping
+            note_failure("manner", "no_mapping")
+            return orig, final, False
+        # swap
+        orig[index[0]] = ""
+        final[index[0]] = new_word
+        slots.take(index[0])
+        return orig, final, True
+    else:
+        note_failure("manner", "no_free_word")
+        return orig, final, False
+
+
+def load_homophone_index(path: str) -> None:
+    """
+    Loads (memory-maps) an offline homophone index built with
+    homophone_index.py. Afterwards homophone lookups never touch
+    wordhoard or the network.
+
+    :params: path - path to homophone index file
+    :returns: None
+    """
+    global HOMOPHONE_INDEX
+    if HOMOPHONE_INDEX is not None:
+        HOMOPHONE_INDEX.close()
+    HOMOPHONE_INDEX = HomophoneIndex(path)
+    lookup_homophones.cache_clear()
+
+
+@lru_cache(maxsize=65536)
+def lookup_homophones(word: str) -> tuple:
+    """
+    Finds the homophones of a word, from the offline index if one is
+    loaded and from wordhoard otherwise. Results are cached per process.
+
+    :params: word - word to look up
+    :returns: [tuple] homophones of the word (empty if none)
+    """
+    if HOMOPHONE_INDEX is not None:
+        return HOMOPHONE_INDEX.lookup(word)
+    if Homophones is None:
+        raise ImportError("wordhoard is not installed. Install it or pass --homophone-index.")
+    possible_homophones = Homophones(word).find_homophones()
+    if possible_homophones is not None and 'no homophones for' not in possible_homophones and len(possible_homophones) != 0:
+        return tuple(re.split(" is a homophone of ", x)[1] for x in possible_homophones)
+    return ()
+
+
+def find_homophone(orig: list, final: list, slots: FreeSlots = None, rng=random):
+    """
+    Swap a word with it's homophone if it exists.
+
+    :params: A list of the original words and a list of the
+    final words in process, slots - FreeSlots tracker for orig
+    (built if not given), rng - random number generator
+    :returns: The updated original list and final list plus
+    a Boolean where if orig and final lists were updated is
+    equal to True, otherwise False
+    """
+    acceptable_characters = {'a','b','c','d','e','f','g','h','i','j','k','l','m','n','o','p','q','r','s','t','u','v','w','x','y','z'}
+    cost = 1
+    if slots is None:
+        slots = FreeSlots(orig)
+    index = slots.choose(cost, rng)
+    if len(index) == 1:
+        word = orig[index[0]]
+        # if contains unusual characters, try a different method
+        if len(set(word.strip()).difference(acceptable_characters)) > 0:
+            note_failure("homophone", "non_ascii_word")
+            return orig, final, False
+        # Find all possible homophones for given word
+        results = lookup_homophones(word)
+        if len(results) != 0:
+            # Randomly select one of the homophones for swapping
+            rand_index = rng.randint(0,len(results)-1)
+            homophone = results[rand_index]
+            # Swap
+            final[index[0]] = homophone
+            orig[index[0]] = ""
+            slots.take(index[0])
+            return orig, final, True
+        else:
+			# No available word homophone for homophone swapping (aka swap unsuccessful)
+            note_failure("homophone", "no_homophone")
+            return orig, final, False
+    else:
+        # No available word in orig for homophone swapping (aka swap unsuccessful)
+        note_failure("homophone", "no_free_word")
+        return orig, final, False
+
+def assimilation(orig: list, final: list, slots: FreeSlots = None, rng=random):
+    """
+    Cheap version of assimilation. Assimilate two words
+    together by removing the first sound of the second
+    word then creating a new word by merging the first
+    word and second edited word together.
+
+    :params: A list of the original words and a list of the
+    final words in process, slots - FreeSlots tracker for orig
+    (built if not given), rng - random number generator
+    :returns: The updated original list and final list plus
+    a Boolean where if orig and final lists were updated is
+    equal to True, otherwise False
+    """
+    cost = 2
+    if slots is None:
+        slots = FreeSlots(orig)
+    indexes = slots.choose(cost, rng)
+    if len(indexes) == 2:
+        word1 = orig[indexes[0]]
+        word2 = orig[indexes[1]]
+        # Merge together
+        word3 = word1[:-1] + word2
+        # Replace slot in final
+        final[indexes[0]] = word3
+        # Replace original with "" in orig
+        orig[indexes[0]] = ""
+        orig[indexes[1]] = ""
+        slots.take(indexes[0])
+        slots.take(indexes[1])
+        return orig, final, True
+    else:
+        # Did not do assimilation successfully since 
+        # not 2 consecutive words available in orig
+        note_failure("assimilation", "no_free_pair")
+        return orig, final, False
+
+def do_noising(orig, final, nType, slots: FreeSlots = None, rng=random):
+    """
+    Noising Control.
+
+    :params: A list of the original words and a list of the
+    final words in process, nType - noising type, slots -
+    FreeSlots tracker for orig, rng - random number generator
+    :returns: Return result of noising if successful, or
+    return original and final lists unaltered with a False
+    boolean if noising type is not listed in the conditional
+    options.
+    """
+    if nType == "assimilation":
+        return assimilation(orig, final, slots, rng)
+    elif nType == "homophone":
+        return find_homophone(orig, final, slots, rng)
+    elif nType == "manner":
+        return manner_swap(orig, final, slots, rng)
+    else:
+        note_failure(nType, "unknown_type")
+        return orig, final, False
+
+
+def try_noising(orig, final, nType, slots: FreeSlots = None, rng=random):
+    """
+    do_noising, timed and counted when stats are enabled.
+    """
+    if NOISE_STATS is None:
+        return do_noising(orig, final, nType, slots, rng)
+    start = time.perf_counter()
+    orig, final, status = do_noising(orig, final, nType, slots, rng)
+    NOISE_STATS.attempt(nType, status, time.perf_counter() - start)
+    return orig, final, status
+
+
+def noise(limit: int, orig: list, final: list, guidebook: dict, rng=random, max_attempts: int = None) -> str:
+    """
+    Core noising function. Loops, noising the given sentence until the
+    limit is reduced to zero. Each noising action has an associated cost
+    that is subtracted from the limit if successful. We know if noising
+    is successful based on the Boolean value returned by each individual
+    noising function. Free words are tracked in a FreeSlots object so
+    every attempt picks its slot in O(1), and the number of attempts
+    (including failed ones) is capped so sentences that cannot reach the
+    limit still finish.
+
+    :params: limit - how many noising operations to perform, orig - the
+    original sentence, final - an array of empty strings the same size as
+    the orig list, guidebook - a dictionary of noising types and their costs,
+    rng - random number generator, max_attempts - cap on noising attempts
+    (default: MAX_ATTEMPTS_PER_WORD per word, at least MIN_ATTEMPTS)
+    :returns: The zipped lists of the original sentence (which should be
+    full of empty strings if noising went well) and the newly noised
+    sentence
+    """
+    if max_attempts is None:
+        max_attempts = max(MIN_ATTEMPTS, MAX_ATTEMPTS_PER_WORD * len(orig))
+    options = list(guidebook.items())
+    slots = FreeSlots(orig)
+    attempts = 0
+    while limit > 0 and attempts < max_attempts and len(slots.singles):
+        attempts += 1
+        # Randomly get type of noising from options so that there is
+        # no noising bias
+        noise_type, cost = rng.choice(options)
+        if (limit - cost) >= 0:
+            orig, final, status = try_noising(orig, final, noise_type, slots, rng)
+            # Status makes sure the noising was successful; if it wasn't this
+            # allows the sentence to be noised in some other way and thus keeps the
+            # percent noised accurate
+            if status is True:
+                #print(f"Type {noise_type} imposed on sentence.")
+                limit = limit - cost
+        elif NOISE_STATS is not None:
+            NOISE_STATS.skip(noise_type)
+    if NOISE_STATS is not None and limit > 0 and attempts >= max_attempts:
+        NOISE_STATS.capped += 1
+    return zip_sentences(orig, final)
+
+
+def line_rng(seed, line_index: int) -> random.Random:
+    """
+    Random number generator for one input line, seeded from
+    (seed, line_index) so a line is always noised the same way no
+    matter which process handles it.
+
+    :params: seed - run seed, line_index - index of the line in the input
+    :returns: [random.Random] generator for the line
+    """
+    return random.Random(f"{seed}:{line_index}")
+
+
+def tokenize_line(line: str):
+    """
+    Normalizes whitespace in a transcript line and splits it into words.
+
+    :params: line - raw line from the transcript file
+    :returns: [tuple] (clean sentence, list of words), or None for
+    empty lines
+    """
+    line = re.sub(r'\s+', ' ', line).rstrip()
+    # do not include empty lines (\n, \t, '', \s, etc)
+    if len(re.findall(r'^[\n\s\t]*$', line)) != 0:
+        return None
+    # tokenize
+    return line, line.split(" ")
+
+
+def noise_tokens(line: str, orig: list, percent: float, guidebook: dict, rng=random) -> str:
+    """
+    Noises an already tokenized sentence.
+
+    :params: line - clean sentence, orig - its words (modified in place),
+    percent - float of percent to be noised, guidebook - a dictionary of
+    noising types and their costs, rng - random number generator
+    :returns: [str] noised sentence
+    """
+    if NOISE_STATS is None:
+        return noise_sentence(line, orig, percent, guidebook, rng)
+    start = time.perf_counter()
+    noised = noise_sentence(line, orig, percent, guidebook, rng)
+    NOISE_STATS.sentences += 1
+    NOISE_STATS.words += len(orig)
+    NOISE_STATS.noising_seconds += time.perf_counter() - start
+    return noised
+
+
+def noise_sentence(line: str, orig: list, percent: float, guidebook: dict, rng=random) -> str:
+    """
+    Noises a tokenized sentence: one manner swap for sentences too short
+    for percent to reach a whole word, else noise().
+    """
+    # get limit
+    limit = float(round(percent*len(orig)))
+    # get final list
+    final = make_final(orig)
+    if limit < 1:
+        # Too small to do more than one noising action
+        small_orig, small_final, boolean = try_noising(orig, final, "manner", rng=rng)
+        if boolean:
+            return zip_sentences(small_orig, small_final)
+        # Too small to be noised so in this case
+        # orig == noised_orig
+        return line
+    # normal noise
+    return noise(limit, orig, final, guidebook, rng)
+
+
+def noise_line(line: str, percent: float, guidebook: dict, rng=random):
+    """
+    Noises one transcript line.
+
+    :params: line - raw line from the transcript file, percent - float
+    of percent to be noised, guidebook - a dictionary of noising types
+    and their costs, rng - random number generator
+    :returns: [list] [noised sentence, clean sentence], or None for
+    empty lines
+    """
+    tokenized = tokenize_line(line)
+    if tokenized is None:
+        return None
+    line, orig = tokenized
+    # add as tuple to noised (they are strings again at this point)
+    return [noise_tokens(line, orig, percent, guidebook, rng), line]
+
+
+def noise_line_variants(line: str, percents: list, guidebook: dict, variants: int = 1, rng=random) -> list:
+    """
+    Noises one transcript line variants times for every percent in
+    percents. The line is tokenized once and per-word lookups (manner
+    tables, homophones) are cached, so extra variants only pay for the
+    noising itself. Variants are drawn one after another from rng, so
+    the first variant of the first percent matches noise_line.
+
+    :params: line - raw line from the transcript file, percents - list
+    of percents to noise with, guidebook - a dictionary of noising types
+    and their costs, variants - noised copies per percent, rng - random
+    number generator
+    :returns: [list] csv rows: [noised, clean] when there is a single
+    percent and variant, else [noised, clean, percent, variant]; empty
+    for empty lines
+    """
+    tokenized = tokenize_line(line)
+    if tokenized is None:
+        return []
+    line, tokens = tokenized
+    if len(percents) == 1 and variants == 1:
+        return [[noise_tokens(line, tokens, percents[0], guidebook, rng), line]]
+    rows = []
+    for percent in percents:
+        for variant in range(variants):
+            rows.append([noise_tokens(line, list(tokens), percent, guidebook, rng), line, percent, variant])
+    return rows
+
+
+def csv_headers(percents: list, variants: int = 1) -> list:
+    """
+    :returns: [list] csv header matching the rows of noise_line_variants
+    """
+    if len(percents) == 1 and variants == 1:
+        return ['befr', 'en']
+    return ['befr', 'en', 'percent', 'variant']
+
+
+def noise_indexed_line(indexed_line: tuple, percents: list, guidebook: dict, seed, variants: int = 1) -> list:
+    """
+    Worker function: noises (line_index, line) with the line's own
+    seeded generator.
+
+    :returns: [list] csv rows for the line (see noise_line_variants)
+    """
+    line_index, line = indexed_line
+    return noise_line_variants(line, percents, guidebook, variants, line_rng(seed, line_index))
+
+
+def noise_indexed_shard(shard: list, percents: list, guidebook: dict, seed, variants: int = 1,
+                        collect_stats: bool = False) -> tuple:
+    """
+    Worker function: noises a shard of (line_index, line) pairs.
+
+    :returns: [tuple] (csv rows per line, NoiseStats of the shard or None)
+    """
+    stats = enable_stats() if collect_stats else None
+    rows = [noise_indexed_line(indexed_line, percents, guidebook, seed, variants) for indexed_line in shard]
+    return rows, stats
+
+
+def init_worker(homophone_index_path: str) -> None:
+    """
+    Worker process initializer; loads the offline homophone index
+    (needed where processes are spawned instead of forked).
+    """
+    if homophone_index_path is not None:
+        load_homophone_index(homophone_index_path)
+
+
+def batched(items, batch_size: int):
+    """
+    Groups an iterable into lists of at most batch_size items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_noised(lines, percents: list, guidebook: dict, seed=None, workers: int = 1,
+                shard_size: int = 256, start_index: int = 0, variants: int = 1):
+    """
+    Yields the csv rows (an empty list for empty lines) of every line in
+    input order. With a seed every line gets its own generator seeded
+    from (seed, line_index), so the output is identical for any number
+    of workers. With more than one worker the lines are sharded across
+    a process pool shard_size lines at a time and merged back in order.
+    At most two shards per worker are in flight (a new one is submitted
+    as the oldest is consumed), so lines can be a lazy iterator over a
+    file of any size.
+
+    :params: lines - iterable of sentences, percents - list of percents
+    to be noised per sentence, guidebook - a dictionary of noising types
+    and their costs, seed - run seed (None uses the global random state,
+    single process only), workers - number of processes, shard_size -
+    lines sent to a worker at a time, start_index - line index of the
+    first line (when resuming part way through a file), variants -
+    noised copies per line and percent
+    :returns: [generator] list of csv rows per line
+    """
+    if seed is None:
+        for line in lines:
+            yield noise_line_variants(line, percents, guidebook, variants)
+        return
+    if workers <= 1:
+        for line_index, line in enumerate(lines, start_index):
+            yield noise_indexed_line((line_index, line), percents, guidebook, seed, variants)
+        return
+    index_path = None if HOMOPHONE_INDEX is None else HOMOPHONE_INDEX.path
+    worker = partial(noise_indexed_shard, percents=percents, guidebook=guidebook, seed=seed,
+                     variants=variants, collect_stats=NOISE_STATS is not None)
+    shards = batched(enumerate(lines, start_index), shard_size)
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(index_path,)) as executor:
+        for shard in itertools.islice(shards, workers * 2):
+            in_flight.append(executor.submit(worker, shard))
+        while in_flight:
+            future = in_flight.popleft()
+            # Keep the pool busy while the oldest shard is waited for
+            for shard in itertools.islice(shards, 1):
+                in_flight.append(executor.submit(worker, shard))
+            rows, stats = future.result()
+            if stats is not None:
+                NOISE_STATS.merge(stats)
+            yield from rows
+
+
+def as_percents(percent) -> list:
+    """
+    :returns: [list] percent as a list of floats (accepts a float, a list
+    or a comma separated string such as "0.1,0.2")
+    """
+    if isinstance(percent, str):
+        return [float(p) for p in percent.split(',') if p != ""]
+    if isinstance(percent, (list, tuple)):
+        return [float(p) for p in percent]
+    return [float(percent)]
+
+
+def control(lines: list, percent, guidebook: dict, seed=None, workers: int = 1, variants: int = 1):
+    """
+    Reads in sentences, performs noising on each sentence according
+    to the noising percentage given.
+
+    :params: lines - list of all sentences, percent - float of percent
+    to be noised per sentence (or a list of percents), guidebook - a
+    dictionary of noising types and their costs, seed - run seed for
+    reproducible output (required for more than one worker; a random
+    one is picked if missing), workers - number of processes, variants -
+    noised copies per sentence and percent
+    """
+    percents = as_percents(percent)
+    if workers > 1 and seed is None:
+        seed = random.randrange(2**32)
+        print(f"No seed given, using seed {seed}")
+    # Compile the manner swap tables for the whole vocabulary up front
+    # (forked workers inherit them)
+    compile_manner_tables({word for line in lines for word in line.split()})
+    orig_noised = []
+    start = time.time()
+    count = 0
+    for rows in tqdm(iter_noised(lines, percents, guidebook, seed, workers, variants=variants), total=len(lines)):
+        if not rows:
+            continue
+        orig_noised.extend(rows)
+        #print(f"ORIG: {rows[0][1]}\nNOISED: {rows[0][0]}")
+        count += 1
+    if NOISE_STATS is not None:
+        NOISE_STATS.wall_seconds += time.time() - start
+    print(f"Total time noising: {time.time() - start}")
+    print(f"Total sentences noised: {count}")
+    return orig_noised
+
+def iter_file(path: str):
+    """
+    Lazily yields the lines of a transcript file.
+
+    :params: path - path to txt file
+    :returns: [generator] lines of the file
+    """
+    try:
+        file = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Directory not found: {path}")
+    with file:
+        yield from file
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def stream_noise(path: str, percent, guidebook: dict, csv_path: str, seed=None,
+                 workers: int = 1, batch_size: int = 1000, checkpoint_path: str = None,
+                 variants: int = 1) -> int:
+    """
+    Streaming version of read_file -> control -> to_csv. Lines are read
+    lazily, noised batch_size lines at a time and appended to the csv
+    as each batch finishes, so memory does not grow with the input.
+    After every batch a checkpoint records the next input line and the
+    csv size; if the run is interrupted, rerunning the same command
+    truncates the csv back to the last committed batch and carries on
+    from there. With a seed the resumed output is identical to an
+    uninterrupted run; a seed drawn because none was given is stored in
+    the checkpoint and reused on resume. The checkpoint is removed once the run finishes.
+
+    :params: path - path to transcripts txt file, percent - float of
+    percent to be noised (or a list of percents), guidebook - a dictionary of noising types and
+    their costs, csv_path - csv file to write, seed - run seed, workers -
+    number of processes, batch_size - lines per committed batch,
+    checkpoint_path - checkpoint file (default: csv_path + '.ckpt'),
+    variants - noised copies per sentence and percent
+    :returns: [int] number of sentences written in this run
+    """
+    percents = as_percents(percent)
+    if checkpoint_path is None:
+        checkpoint_path = csv_path + ".ckpt"
+    checkpoint = None
+    if os.path.exists(checkpoint_path) and os.path.exists(csv_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        if seed is None:
+            # Resume with the seed the interrupted run drew (if any)
+            seed = checkpoint["settings"]["seed"]
+    if workers > 1 and seed is None:
+        seed = random.randrange(2**32)
+        print(f"No seed given, using seed {seed}")
+    settings = {"input": os.path.abspath(path), "percents": percents, "variants": variants, "seed": seed}
+    start_line = 0
+    if checkpoint is not None:
+        if checkpoint["settings"] != settings:
+            raise ValueError(f"Checkpoint {checkpoint_path} was written with different settings: {checkpoint['settings']}")
+        start_line = checkpoint["line"]
+        output = open(csv_path, 'r+b')
+        output.truncate(checkpoint["offset"])
+        output.seek(checkpoint["offset"])
+        print(f"Resuming from line {start_line}")
+    else:
+        output = open(csv_path, 'wb')
+        header = io.StringIO()
+        csv.writer(header).writerow(csv_headers(percents, variants))
+        output.write(header.getvalue().encode('utf-8'))
+
+    start = time.time()
+    count = 0
+    with output:
+        lines = itertools.islice(iter_file(path), start_line, None)
+        noised = iter_noised(lines, percents, guidebook, seed, workers, start_index=start_line, variants=variants)
+        next_line = start_line
+        # iter_noised yields one item per input line, so batches of results
+        # line up with batches of input lines
+        for batch in batched(noised, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for rows in batch:
+                if rows:
+                    writer.writerows(rows)
+                    count += 1
+            output.write(buffer.getvalue().encode('utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+            next_line += len(batch)
+            write_checkpoint(checkpoint_path, {"settings": settings, "line": next_line, "offset": output.tell()})
+            print(f"\rLines committed: {next_line}", end='')
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if NOISE_STATS is not None:
+        NOISE_STATS.wall_seconds += time.time() - start
+    print(f"\nTotal time noising: {time.time() - start}")
+    print(f"Total sentences noised: {count}")
+    print(f"Noised data written to CSV file at {csv_path}")
+    return count
+
+
+def noise_batch(sentences: list, percent: float, guidebook: dict = None, rng=random) -> list:
+    """
+    Library entry point: noises a batch of sentences in memory, with no
+    csv in between.
+
+    :params: sentences - list of sentences, percent - float of percent to
+    be noised per sentence, guidebook - a dictionary of noising types and
+    their costs (default: DEFAULT_GUIDEBOOK), rng - random number generator
+    (pass a random.Random for reproducible batches)
+    :returns: [list] noised sentence for every input sentence, in order
+    (empty sentences stay empty)
+    """
+    if guidebook is None:
+        guidebook = DEFAULT_GUIDEBOOK
+    noised = []
+    for sentence in sentences:
+        tokenized = tokenize_line(sentence)
+        if tokenized is None:
+            noised.append("")
+            continue
+        line, orig = tokenized
+        noised.append(noise_tokens(line, orig, percent, guidebook, rng))
+    return noised
+
+
+class NoisedDataset(IterableDataset):
+    """
+    Iterable dataset that noises transcripts on the fly, e.g. inside a
+    torch DataLoader, so every epoch sees fresh noise and no noised csv
+    or json has to be written. Yields {"befr": noised, "en": clean}
+    records like the seq2seq json files. Lines are spread over DataLoader
+    workers by line number.
+
+    Without a seed every pass draws new noise. With a seed the noise of
+    a line depends only on (seed, epoch, line number); call set_epoch at
+    the start of every epoch to get new noise.
+
+    :params: source - path to a transcripts txt file (read lazily) or a
+    list of sentences, percent - float of percent to be noised per
+    sentence, guidebook - a dictionary of noising types and their costs
+    (default: DEFAULT_GUIDEBOOK), seed - run seed, homophone_index - path
+    to an offline homophone index (loaded in every worker)
+    """
+
+    def __init__(self, source, percent: float, guidebook: dict = None, seed=None,
+                 homophone_index: str = None):
+        self.source = source
+        self.percent = float(percent)
+        self.guidebook = DEFAULT_GUIDEBOOK if guidebook is None else guidebook
+        self.seed = seed
+        self.homophone_index = homophone_index
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _lines(self):
+        if isinstance(self.source, str):
+            return iter_file(self.source)
+        return iter(self.source)
+
+    def __iter__(self):
+        if self.homophone_index is not None and \
+                (HOMOPHONE_INDEX is None or HOMOPHONE_INDEX.path != self.homophone_index):
+            load_homophone_index(self.homophone_index)
+        worker_id, num_workers = 0, 1
+        if get_worker_info is not None and get_worker_info() is not None:
+            worker_id, num_workers = get_worker_info().id, get_worker_info().num_workers
+        rng = random.Random()
+        for line_index, line in enumerate(self._lines()):
+            if line_index % num_workers != worker_id:
+                continue
+            tokenized = tokenize_line(line)
+            if tokenized is None:
+                continue
+            clean, orig = tokenized
+            if self.seed is not None:
+                rng = line_rng(f"{self.seed}:{self.epoch}", line_index)
+            yield {"befr": noise_tokens(clean, orig, self.percent, self.guidebook, rng), "en": clean}
+
+
+def to_csv(sentences: list, output_path: str, file_name: str, headers: list = None) -> None:
+    """
+    Takes a list of noised and clean sentences and writes them to
+    a csv file.
+
+    :params: sentences - list of all sentences, output_path - directory
+    to which the csv file will be written, file_name - name of file to
+    be written, headers - csv header (default: befr, en)
+    :returns: None
+    """
+    path      = os.path.join(output_path, file_name)
+    # open file to write 
+    file      = open(path, "w", encoding="utf-8", newline='')
+    # create instance of csv writer
+    writer    = csv.writer(file)
+    # headers
+    if headers is None:
+        headers = ['befr', 'en']
+    # write headers first
+    writer.writerow(headers)
+    # write data to file
+    writer.writerows(sentences)
+    print(f"Noised data writtent to CSV file at {path}")
+
+
+def write_stats(stats_path: str) -> None:
+    """
+    Prints the noising stats and writes them to stats_path as JSON
+    (no-op when stats are not enabled).
+    """
+    if NOISE_STATS is None or stats_path is None:
+        return
+    print(NOISE_STATS.report())
+    with open(stats_path, 'w', encoding='utf-8') as file:
+        json.dump(NOISE_STATS.to_dict(), file, indent=2)
+    print(f"Noising stats written to {stats_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path",         required=True,   help="Path to txt file containing transcripts")
+    parser.add_argument("--percent",      required=True,   help="Percent of data to be noised (comma separated list for several noise levels)")
+    parser.add_argument("--variants",     default=1, type=int, help="Noised copies of every sentence per percent")
+    parser.add_argument("--outpath",      required=True,   help="Path to which to write noised/unnoised sentence pair csv")
+    parser.add_argument("--output-name",  required=True,   help="Name for new noised csv file")
+    parser.add_argument("--homophone-index",                help="Offline homophone index built with homophone_index.py (no network lookups)")
+    parser.add_argument("--workers",      default=1, type=int, help="Number of processes to noise with")
+    parser.add_argument("--seed",         default=None,    help="Seed for reproducible noising (output is identical for any --workers)")
+    parser.add_argument("--stream",       action="store_true", help="Read, noise and write in batches with a resumable checkpoint (constant memory)")
+    parser.add_argument("--batch-size",   default=1000, type=int, help="Lines per committed batch in --stream mode")
+    parser.add_argument("--checkpoint",   default=None,    help="Checkpoint file for --stream mode (default: output csv + .ckpt)")
+    parser.add_argument("--stats",        default=None,    help="Write per noise type attempt/failure/timing stats to this JSON file")
+    args = parser.parse_args()
+
+    if args.stats is not None:
+        enable_stats()
+
+    if args.homophone_index is not None:
+        load_homophone_index(args.homophone_index)
+
+    # Weights for each noising type
+    guidelines = dict(DEFAULT_GUIDEBOOK)
+
+    if args.stream:
+        name = f"NOISED-{args.percent.replace(',', '_')}_{args.output_name}.csv"
+        stream_noise(args.path, args.percent, guidelines, os.path.join(args.outpath, name),
+                     args.seed, args.workers, args.batch_size, args.checkpoint, args.variants)
+        write_stats(args.stats)
+        return
+
+    file_lines   = read_file(args.path)
+    output  = control(file_lines, args.percent, guidelines, args.seed, args.workers, args.variants)
+    outPath = os.path.join(args.outpath,"")
+    name    = f"NOISED-{args.percent.replace(',', '_')}_{args.output_name}.csv"
+    to_csv(output, outPath, name, csv_headers(as_percents(args.percent), args.variants))
+    write_stats(args.stats)
+
+
+if __name__ == "__main__":
+    main()
+
+
+
@@ -1,133 +1,588 @@
-"""
-Author: Riah Coulter
-Date: 7-13-21
-Purpose: Reads in csv from wav2vec prediction output and reformats the target
-         and reference predictions into the following json structure:
-        {
-         translation:
-         [{"befr": "alpha bada seven", "en": "alpha beta seven"}
-         {"befr": "ten fur okya", "en": "ten four okay"}]
-        }
-         So that a transformer model (such as mBART or Bert2Bert) that was trained
-         on a translation task can be fine-tuned as a Grammar Error Checker (GEC)
-         for the target data.
-"""
-import csv
-import json
-import argparse
-import random
-import os
-
-def create_split(contents: list, percentage: float):
-    """
-    Creates a split in the data based on the percentage
-    given. Useful for establishing train/validation/test splits.
-
-    :params: contents - [list] all sentences, percentage - [float] 
-    amount to be split off (0.12 == 12%)
-    :returns: [list] remaining sentences, [list] sentences split off
-    """
-    perc_of_items = int(len(contents)*percentage)
-    split_indicies = random.sample(range(len(contents)),perc_of_items)
-    
-    split     = []
-    non_split = []
-    for i in range(len(contents)):
-        if i in split_indicies:
-            split.append(contents[i])
-        else:
-            non_split.append(contents[i])
-    return non_split, split
-    
-def write_to_json(output: dict, output_dir: str, data_type: str, unique_name: str):
-    """
-    Takes formatted dictionary and writes it to a JSON file.
-
-    :params: [dict] output - dictionary of information, [str] output_dir - directory
-    to where the JSON file will be written, [str] data_type - either train, validation
-    or test, [str] unique_name - name for new JSON file to be written
-    """
-    if not os.path.exists(output_dir):
-        try:
-            os.makedirs(output_dir)
-        except Exception as e:
-            print(e)
-            raise
-    file_path = os.path.join(output_dir, (unique_name + '_seq2seq_' + data_type + '.json'))
-    
-    with open(file_path, 'w') as file:
-        json.dump(output, file)
-    print(f"{data_type} json file successfully written!")
-
-def write_to_csv(contents: list, output_dir: str, data_type: str):
-    """
-    CSV Function depracated.
-    """
-    name = "seq2seq_" + data_type + ".csv"
-    output_file = open(os.path.join(output_dir, name), 'w', encoding='utf-8', newline='')
-    writer = csv.writer(output_file)
-    #write header
-    writer.writerow(['translation'])
-    for line in contents:
-        writer.writerow(line)
-    output_file.close()
-    print(f"{data_type} csv file successfully written!")
-
-def main():
-    """
-    Reads in information from user, reformats data into a large dictionary
-    of training pairs, validation pairs and (optional) test pairs to be 
-    written to JSON files.
-    """
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--name",        required=True,   help="Name to uniquely identify output JSON file")
-    parser.add_argument("--files",       required=True,   help="Comma separated string of csv files (or paths to files) to process and reformat")
-    parser.add_argument("--output-dir",  required=True,   help="Directory to save new json files to.")
-    parser.add_argument("--val-split",   required=True,   help="Percentage (as decimal) of data to be used for validation")
-    parser.add_argument("--csvIndices", required=True,   help="Column indices to grab for source-target sentences (ex: 5,6 with 5 being source and 6 target)")
-    parser.add_argument("--test-split",                   help="Percentage (as decimal) of data to be used for testing")
-    args = parser.parse_args()
-
-    
-    all_contents = []
-    files = args.files.split(',')
-    indices = args.csvIndices.split(',')
-    if len(indices) != 2:
-        print("Either source or target index missing. Must be separated by a comma: 5,6 with 5 being source and 6 being target.")
-        exit()
-    sourceIndex = int(indices[0])
-    targetIndex = int(indices[1])
-    for file in files:
-        print(f"Reading {file}...")
-        with open(file, mode = 'r') as opened:
-            csvFile = csv.reader(opened)
-            # format and add to all_contents
-            count = 0
-            for line in csvFile:
-                if count > 0 and line[sourceIndex] != "" and line[targetIndex] != "":
-                    dictionary = {"befr": line[sourceIndex], "en": line[targetIndex]}
-                    all_contents.append(dictionary)
-                else:
-                    count += 1
-    training_data = all_contents
-    if args.val_split is not None:
-        training_data, val_data  = create_split(training_data, float(args.val_split))
-        validate = {}
-        validate["translation"] = val_data
-        dataset = {}
-        dataset['data'] = validate
-        write_to_json(dataset, args.output_dir, "validation", args.name)
-    if args.test_split is not None:
-        training_data, test_data = create_split(training_data, float(args.test_split))
-        test = {}
-        test["translation"] = test_data
-        write_to_json(test, args.output_dir, "test", args.name)
-    train = {}
-    train["translation"] = training_data
-    dataset = {}
-    dataset['data'] = train
-    write_to_json(dataset, args.output_dir, "train", args.name)
-
-        
-if __name__ == "__main__":
-    main()
+"""
+Author: Riah Coulter
+Date: 7-13-21
+Purpose: Reads in csv from wav2vec prediction output and reformats the target
+         and reference predictions into the following json structure:
+        {
+         translation:
+         [{"befr": "alpha bada seven", "en": "alpha beta seven"}
+         {"befr": "ten fur okya", "en": "ten four okay"}]
+        }
+         So that a transformer model (such as mBART or Bert2Bert) that was trained
+         on a translation task can be fine-tuned as a Grammar Error Checker (GEC)
+         for the target data.
+
+         Pairs are streamed from the csv files and each pair is assigned to
+         train/validation/test from a hash of the pair, so memory stays flat,
+         every split is written as it streams and the same pair always lands
+         in the same split across reruns (change --seed to reshuffle).
+
+         With --format jsonl, parquet or arrow each split is instead written
+         as size-bounded shards (one {"translation": {"befr": ..., "en": ...}}
+         record per row, as the Huggingface translation examples expect) that
+         can be streamed or memory-mapped, encoded and written in parallel.
+
+         --dedup exact|near finds duplicate pairs before they are written:
+         exact duplicates by hash and near duplicates (e.g. several noised
+         variants of one sentence) with MinHash + LSH over an on-disk SQLite
+         index, so memory stays bounded for millions of pairs. Duplicates are
+         dropped, reported, or grouped into the split of the pair they
+         duplicate so nothing leaks between train and validation/test.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import io
+import json
+import argparse
+import hashlib
+import itertools
+import random
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+
+from line_chunks import plan_chunks
+
+try:
+    import numpy as np
+except ImportError:
+    # Only needed for --dedup near
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Only needed for --format parquet/arrow
+    pa = None
+
+SHARD_EXTENSIONS = {"jsonl": ".jsonl", "parquet": ".parquet", "arrow": ".arrow"}
+
+# MinHash permutations ((a*x + b) mod MINHASH_PRIME), fixed so signatures are comparable across runs
+MINHASH_PRIME = (1 << 31) - 1
+
+def create_split(contents: list, percentage: float):
+    """
+    Creates a split in the data based on the percentage
+    given. Useful for establishing train/validation/test splits.
+
+    :params: contents - [list] all sentences, percentage - [float] 
+    amount to be split off (0.12 == 12%)
+    :returns: [list] remaining sentences, [list] sentences split off
+    """
+    perc_of_items = int(len(contents)*percentage)
+    split_indicies = set(random.sample(range(len(contents)),perc_of_items))
+    
+    split     = []
+    non_split = []
+    for i in range(len(contents)):
+        if i in split_indicies:
+            split.append(contents[i])
+        else:
+            non_split.append(contents[i])
+    return non_split, split
+
+def pair_fraction(pair: dict, seed: str = "") -> float:
+    """
+    Deterministic pseudo-random number for a pair: the same pair (and
+    seed) always gives the same number, on any machine and in any run.
+
+    :params: pair - [dict] {"befr": ..., "en": ...}, seed - [str] salt
+    to reshuffle the splits
+    :returns: [float] number in [0, 1)
+    """
+    key = f"{seed}\0{pair['befr']}\t{pair['en']}".encode('utf-8')
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2**64
+
+def assign_split(pair: dict, val_split: float, test_split: float, seed: str = "") -> str:
+    """
+    Assigns a pair to a split in O(1) from its hash. As with create_split,
+    validation takes val_split of all pairs and test takes test_split of
+    the remaining pairs.
+
+    :params: pair - [dict] {"befr": ..., "en": ...}, val_split - [float]
+    validation fraction, test_split - [float] test fraction of what is
+    left after validation (0 for no test split), seed - [str] salt
+    :returns: [str] "train", "validation" or "test"
+    """
+    fraction = pair_fraction(pair, seed)
+    if fraction < val_split:
+        return "validation"
+    if fraction < val_split + test_split*(1 - val_split):
+        return "test"
+    return "train"
+
+def normalize_pair(pair: dict) -> str:
+    """
+    :returns: [str] lowercased, whitespace-collapsed "befr\ten" text of a pair
+    """
+    return re.sub(r'\s+', ' ', pair['befr']).strip().lower() + "\t" + re.sub(r'\s+', ' ', pair['en']).strip().lower()
+
+def signed_digest(data: bytes) -> int:
+    """
+    :returns: [int] 64 bit hash of data that fits an SQLite INTEGER
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+class PairDeduplicator:
+    """
+    Finds exact and near duplicate pairs in a stream. Every pair that is
+    kept is stored (hash, MinHash signature, text, split) in an SQLite
+    database and its LSH band keys in an index, so later pairs are checked
+    with one indexed query and memory does not grow with the dataset.
+    Passing the same db_path again dedups new data against earlier runs.
+
+    Near duplicates are pairs whose character shingles have an estimated
+    Jaccard similarity of at least threshold. What happens to a duplicate
+    depends on action: "drop" drops it, "report" keeps it where its hash
+    puts it, and "group" keeps it in the split of the pair it duplicates.
+    Every duplicate is written to report_path (JSON lines), flagged as a
+    leak when it would land in a different split than its match.
+    """
+    def __init__(self, near: bool = True, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, action: str = "drop", db_path: str = None, report_path: str = None):
+        if near and np is None:
+            raise ImportError("--dedup near needs numpy (pip install numpy)")
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.near = near
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.action = action
+        if near:
+            rng = np.random.RandomState(2021)
+            self.a = rng.randint(1, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+            self.b = rng.randint(0, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self.tmp_dir = None
+        if db_path is None:
+            self.tmp_dir = tempfile.TemporaryDirectory()
+            db_path = os.path.join(self.tmp_dir.name, "dedup.db")
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pairs (id INTEGER PRIMARY KEY, digest INTEGER NOT NULL UNIQUE, "
+            "sig BLOB, befr TEXT NOT NULL, en TEXT NOT NULL, split TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS lsh (band INTEGER NOT NULL, key INTEGER NOT NULL, "
+            "pair_id INTEGER NOT NULL, PRIMARY KEY (band, key, pair_id)) WITHOUT ROWID")
+        self.report = open(report_path, 'w', encoding='utf-8') if report_path is not None else None
+        self.counts = {"pairs": 0, "kept": 0, "exact": 0, "near": 0, "leaks": 0, "dropped": 0}
+
+    def signature(self, text: str):
+        """
+        :returns: [np.ndarray] MinHash signature (uint32) of the character
+        shingles of text
+        """
+        k = self.shingle_size
+        shingles = {text[i:i + k] for i in range(max(len(text) - k + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(x, self.a) + self.b) % MINHASH_PRIME).min(axis=0).astype(np.uint32)
+
+    def band_keys(self, sig) -> list:
+        return [(band, signed_digest(sig[band*self.rows:(band + 1)*self.rows].tobytes()))
+                for band in range(self.bands)]
+
+    def find_near(self, sig, keys: list):
+        """
+        :returns: [tuple] (similarity, befr, en, split) of the most similar
+        stored pair at or above the threshold, or None
+        """
+        # One indexed lookup per band (a row-value IN list would scan the table)
+        buckets = " UNION ".join("SELECT pair_id FROM lsh WHERE band = ? AND key = ?" for _ in keys)
+        params = [value for key in keys for value in key]
+        rows = self.conn.execute(
+            f"SELECT sig, befr, en, split FROM pairs WHERE id IN ({buckets})", params).fetchall()
+        best = None
+        for blob, befr, en, split in rows:
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == sig))
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, befr, en, split)
+        return best
+
+    def process(self, pair: dict, split: str):
+        """
+        Checks one pair against every pair kept so far.
+
+        :params: pair - [dict] {"befr": ..., "en": ...}, split - [str] the
+        split the pair's hash assigns it to
+        :returns: [str] split to write the pair to, or None to drop it
+        """
+        self.counts["pairs"] += 1
+        text = normalize_pair(pair)
+        digest = signed_digest(text.encode('utf-8'))
+        match = self.conn.execute("SELECT befr, en, split FROM pairs WHERE digest = ?", (digest,)).fetchone()
+        kind, similarity = "exact", 1.0
+        sig = keys = None
+        if match is None and self.near:
+            sig = self.signature(text)
+            keys = self.band_keys(sig)
+            near = self.find_near(sig, keys)
+            if near is not None:
+                kind, similarity, match = "near", near[0], near[1:]
+        if match is None:
+            self.keep(pair, split, digest, sig, keys)
+            return split
+        self.counts[kind] += 1
+        leak = match[2] != split and self.action != "group"
+        self.counts["leaks"] += int(leak)
+        if self.report is not None:
+            self.report.write(json.dumps({"befr": pair['befr'], "en": pair['en'], "split": split, "kind": kind,
+                                          "similarity": round(similarity, 3), "leak": leak,
+                                          "match": {"befr": match[0], "en": match[1], "split": match[2]}}) + "\n")
+        if self.action == "drop":
+            self.counts["dropped"] += 1
+            return None
+        if self.action == "group":
+            return match[2]
+        return split
+
+    def keep(self, pair: dict, split: str, digest: int, sig, keys) -> None:
+        self.counts["kept"] += 1
+        cursor = self.conn.execute("INSERT INTO pairs (digest, sig, befr, en, split) VALUES (?, ?, ?, ?, ?)",
+                                   (digest, None if sig is None else sig.tobytes(), pair['befr'], pair['en'], split))
+        if keys is not None:
+            self.conn.executemany("INSERT OR IGNORE INTO lsh (band, key, pair_id) VALUES (?, ?, ?)",
+                                  [(band, key, cursor.lastrowid) for band, key in keys])
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+        if self.report is not None:
+            self.report.close()
+        if self.tmp_dir is not None:
+            self.tmp_dir.cleanup()
+
+def iter_pairs(files: list, sourceIndex: int, targetIndex: int):
+    """
+    Streams source-target pairs from csv files (read as UTF-8), skipping
+    each file's header and rows with an empty source or target.
+
+    :params: files - [list] csv files, sourceIndex - [int] source column,
+    targetIndex - [int] target column
+    :returns: [generator] {"befr": source, "en": target} dictionaries
+    """
+    for file in files:
+        print(f"Reading {file}...")
+        with open(file, mode = 'r', encoding = 'utf-8', newline = '') as opened:
+            csvFile = csv.reader(opened)
+            count = 0
+            for line in csvFile:
+                if count > 0 and line[sourceIndex] != "" and line[targetIndex] != "":
+                    yield {"befr": line[sourceIndex], "en": line[targetIndex]}
+                else:
+                    count += 1
+
+def read_pairs_chunk(chunk: tuple, sourceIndex: int, targetIndex: int) -> list:
+    """
+    Worker function: parses the pairs of one byte range of a csv file
+    with the same rules as iter_pairs (the file's first row is its header).
+
+    :params: chunk - [tuple] (file, start, end, first chunk of file),
+    sourceIndex - [int] source column, targetIndex - [int] target column
+    :returns: [list] {"befr": source, "en": target} dictionaries
+    """
+    file, start, end, first = chunk
+    with open(file, 'rb') as opened:
+        opened.seek(start)
+        data = opened.read(end - start).decode('utf-8')
+    pairs = []
+    count = 0 if first else 1
+    for line in csv.reader(io.StringIO(data, newline='')):
+        if count > 0 and line[sourceIndex] != "" and line[targetIndex] != "":
+            pairs.append({"befr": line[sourceIndex], "en": line[targetIndex]})
+        else:
+            count += 1
+    return pairs
+
+def iter_pairs_parallel(files: list, sourceIndex: int, targetIndex: int, workers: int,
+                        chunk_bytes: int = 64*1024*1024):
+    """
+    Same pairs in the same order as iter_pairs, but the files (and byte
+    ranges of large files) are parsed in a process pool. Chunks are
+    merged back in file order and only a few chunks per worker are in
+    flight at a time.
+
+    :params: files - [list] csv files, sourceIndex - [int] source column,
+    targetIndex - [int] target column, workers - [int] processes,
+    chunk_bytes - [int] approximate chunk size (0 for whole files)
+    :returns: [generator] {"befr": source, "en": target} dictionaries
+    """
+    chunks = iter(plan_chunks(files, chunk_bytes))
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in itertools.islice(chunks, workers*2):
+            in_flight.append((chunk, executor.submit(read_pairs_chunk, chunk, sourceIndex, targetIndex)))
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            # Keep the pool busy while the oldest chunk is consumed
+            for next_chunk in itertools.islice(chunks, 1):
+                in_flight.append((next_chunk, executor.submit(read_pairs_chunk, next_chunk, sourceIndex, targetIndex)))
+            if chunk[3]:
+                print(f"Reading {chunk[0]}...")
+            yield from future.result()
+
+def split_path(output_dir: str, data_type: str, unique_name: str) -> str:
+    """
+    :returns: [str] path of the JSON file of a split
+    """
+    return os.path.join(output_dir, (unique_name + '_seq2seq_' + data_type + '.json'))
+
+class JsonSplitWriter:
+    """
+    Streams the pairs of one split into the same JSON file write_to_json
+    would write ({"data": {"translation": [...]}}, or {"translation": [...]}
+    when nested is False) one pair at a time.
+    """
+    def __init__(self, file_path: str, nested: bool = True):
+        self.file = open(file_path, 'w')
+        self.nested = nested
+        self.count = 0
+        self.file.write('{"data": {"translation": [' if nested else '{"translation": [')
+
+    def write(self, pair: dict) -> None:
+        if self.count > 0:
+            self.file.write(', ')
+        self.file.write(json.dumps(pair))
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.write(']}}' if self.nested else ']}')
+        self.file.close()
+    
+def write_shard(befr: list, en: list, file_path: str, output_format: str) -> int:
+    """
+    Writes one shard of a split. Runs in a worker process.
+
+    :params: befr - [list] source sentences, en - [list] target sentences,
+    file_path - [str] shard path, output_format - [str] jsonl, parquet or arrow
+    :returns: [int] number of pairs written
+    """
+    tmp_path = file_path + ".tmp"
+    if output_format == "jsonl":
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps({"translation": {"befr": source, "en": target}}) + "\n"
+                            for source, target in zip(befr, en))
+    else:
+        translation = pa.StructArray.from_arrays([pa.array(befr, type=pa.string()), pa.array(en, type=pa.string())],
+                                                 names=["befr", "en"])
+        table = pa.table({"translation": translation})
+        if output_format == "parquet":
+            pq.write_table(table, tmp_path)
+        else:
+            # Arrow IPC file; can be memory-mapped with pa.memory_map + pa.ipc.open_file
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+    os.replace(tmp_path, file_path)
+    return len(befr)
+
+class ShardQueue:
+    """
+    Hands full shards to an executor. At most max_pending shards, counted
+    over all splits together, are in flight; submit blocks until one of
+    them is written.
+    """
+    def __init__(self, executor, max_pending: int):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = set()
+
+    def submit(self, *args) -> None:
+        while len(self.pending) >= self.max_pending:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self.pending.add(self.executor.submit(write_shard, *args))
+
+    def close(self) -> None:
+        for future in self.pending:
+            future.result()
+        self.pending = set()
+
+class ShardedSplitWriter:
+    """
+    Streams the pairs of one split into numbered shards of about
+    max_shard_bytes of text each (name_seq2seq_split-00000.jsonl, ...).
+    The current shard is buffered as two lists of strings. Full shards are
+    written in place, or handed to a ShardQueue so encoding and writing
+    run in parallel with reading.
+    """
+    def __init__(self, output_dir: str, data_type: str, unique_name: str, output_format: str,
+                 max_shard_bytes: int, queue: ShardQueue = None):
+        self.prefix = os.path.join(output_dir, unique_name + '_seq2seq_' + data_type)
+        self.output_format = output_format
+        self.max_shard_bytes = max_shard_bytes
+        self.queue = queue
+        self.befr = []
+        self.en = []
+        self.size = 0
+        self.shards = 0
+        self.count = 0
+
+    def write(self, pair: dict) -> None:
+        self.befr.append(pair['befr'])
+        self.en.append(pair['en'])
+        # Rough encoded size: the text plus the JSON around it
+        self.size += len(pair['befr']) + len(pair['en']) + 40
+        self.count += 1
+        if self.size >= self.max_shard_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.befr:
+            return
+        file_path = f"{self.prefix}-{self.shards:05d}{SHARD_EXTENSIONS[self.output_format]}"
+        if self.queue is None:
+            write_shard(self.befr, self.en, file_path, self.output_format)
+        else:
+            self.queue.submit(self.befr, self.en, file_path, self.output_format)
+        self.shards += 1
+        self.befr = []
+        self.en = []
+        self.size = 0
+
+    def close(self) -> None:
+        self.flush()
+
+def write_to_json(output: dict, output_dir: str, data_type: str, unique_name: str):
+    """
+    Takes formatted dictionary and writes it to a JSON file.
+
+    :params: [dict] output - dictionary of information, [str] output_dir - directory
+    to where the JSON file will be written, [str] data_type - either train, validation
+    or test, [str] unique_name - name for new JSON file to be written
+    """
+    if not os.path.exists(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except Exception as e:
+            print(e)
+            raise
+    file_path = split_path(output_dir, data_type, unique_name)
+    
+    with open(file_path, 'w') as file:
+        json.dump(output, file)
+    print(f"{data_type} json file successfully written!")
+
+def write_to_csv(contents: list, output_dir: str, data_type: str):
+    """
+    CSV Function depracated.
+    """
+    name = "seq2seq_" + data_type + ".csv"
+    output_file = open(os.path.join(output_dir, name), 'w', encoding='utf-8', newline='')
+    writer = csv.writer(output_file)
+    #write header
+    writer.writerow(['translation'])
+    for line in contents:
+        writer.writerow(line)
+    output_file.close()
+    print(f"{data_type} csv file successfully written!")
+
+def main():
+    """
+    Reads in information from user, streams the csv pairs and writes
+    each one to the training, validation or (optional) test JSON file
+    its hash assigns it to.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name",        required=True,   help="Name to uniquely identify output JSON file")
+    parser.add_argument("--files",       required=True,   help="Comma separated string of csv files (or paths to files) to process and reformat")
+    parser.add_argument("--output-dir",  required=True,   help="Directory to save new json files to.")
+    parser.add_argument("--val-split",   required=True,   help="Percentage (as decimal) of data to be used for validation")
+    parser.add_argument("--csvIndices", required=True,   help="Column indices to grab for source-target sentences (ex: 5,6 with 5 being source and 6 target)")
+    parser.add_argument("--test-split",                   help="Percentage (as decimal) of data to be used for testing")
+    parser.add_argument("--seed",        default="",      help="Salt for the pair hashes; change it to get different splits")
+    parser.add_argument("--format",      default="json",  choices=["json", "jsonl", "parquet", "arrow"], help="Output format; jsonl/parquet/arrow are written as shards")
+    parser.add_argument("--shard-mb",    default=64, type=float, help="Approximate size of each shard in MB of text (sharded formats); memory use is about (splits + workers) shards")
+    parser.add_argument("--workers",     default=1, type=int, help="Processes encoding and writing shards in parallel (sharded formats)")
+    parser.add_argument("--read-workers", default=1, type=int, help="Processes parsing the csv files (and chunks of large files) in parallel")
+    parser.add_argument("--chunk-mb",    default=64, type=float, help="Approximate size of the chunks large csv files are split into with --read-workers (0 reads files whole)")
+    parser.add_argument("--dedup",       default="none", choices=["none", "exact", "near"], help="Find exact (hash) or exact and near (MinHash/LSH) duplicate pairs")
+    parser.add_argument("--dedup-action", default="drop", choices=["drop", "report", "group"], help="Drop duplicates, only report them, or put them in the split of the pair they duplicate")
+    parser.add_argument("--dedup-threshold", default=0.8, type=float, help="Estimated Jaccard similarity at which pairs count as near duplicates")
+    parser.add_argument("--dedup-report", default=None,   help="JSON lines file listing every duplicate and whether it leaks across splits")
+    parser.add_argument("--dedup-db",    default=None,    help="SQLite file for the dedup index (reuse it to dedup against earlier runs; default: temporary)")
+    args = parser.parse_args()
+    if args.format in ("parquet", "arrow") and pa is None:
+        parser.error(f"--format {args.format} needs pyarrow (pip install pyarrow)")
+
+    files = args.files.split(',')
+    indices = args.csvIndices.split(',')
+    if len(indices) != 2:
+        print("Either source or target index missing. Must be separated by a comma: 5,6 with 5 being source and 6 being target.")
+        exit()
+    sourceIndex = int(indices[0])
+    targetIndex = int(indices[1])
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    val_split = float(args.val_split) if args.val_split is not None else 0.0
+    test_split = float(args.test_split) if args.test_split is not None else 0.0
+
+    data_types = []
+    if args.val_split is not None:
+        data_types.append("validation")
+    if args.test_split is not None:
+        data_types.append("test")
+    data_types.append("train")
+
+    executor = None
+    queue = None
+    if args.format != "json" and args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        # Shared by all splits, so at most one shard per worker is in flight
+        queue = ShardQueue(executor, args.workers)
+    # One writer per split; the test json file has no "data" level
+    writers = {}
+    for data_type in data_types:
+        if args.format == "json":
+            writers[data_type] = JsonSplitWriter(split_path(args.output_dir, data_type, args.name),
+                                                 nested=data_type != "test")
+        else:
+            writers[data_type] = ShardedSplitWriter(args.output_dir, data_type, args.name, args.format,
+                                                    int(args.shard_mb * 1024 * 1024), queue)
+    deduplicator = None
+    if args.dedup != "none":
+        deduplicator = PairDeduplicator(near=args.dedup == "near", threshold=args.dedup_threshold,
+                                        action=args.dedup_action, db_path=args.dedup_db,
+                                        report_path=args.dedup_report)
+    if args.read_workers > 1:
+        pairs = iter_pairs_parallel(files, sourceIndex, targetIndex, args.read_workers,
+                                    int(args.chunk_mb * 1024 * 1024))
+    else:
+        pairs = iter_pairs(files, sourceIndex, targetIndex)
+    try:
+        for pair in pairs:
+            split = assign_split(pair, val_split, test_split, args.seed)
+            if deduplicator is not None:
+                split = deduplicator.process(pair, split)
+                if split is None:
+                    continue
+            writers[split].write(pair)
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if queue is not None:
+            queue.close()
+        if executor is not None:
+            executor.shutdown()
+        if deduplicator is not None:
+            deduplicator.close()
+    if deduplicator is not None:
+        counts = deduplicator.counts
+        print(f"Dedup: {counts['pairs']} pairs, {counts['exact']} exact and {counts['near']} near duplicates, "
+              f"{counts['leaks']} leaking across splits, {counts['dropped']} dropped")
+    for data_type, writer in writers.items():
+        if args.format == "json":
+            print(f"{data_type} json file successfully written! ({writer.count} pairs)")
+        else:
+            print(f"{data_type} {args.format} shards successfully written! ({writer.count} pairs in {writer.shards} shards)")
+
+        
+if __name__ == "__main__":
+    main()
@@ -5,56 +5,211 @@ Creates a lexicon for wav2vec2 training/validation data
 
 Note: Slightly modified for efficiency and ease of usage in Colab
 
+Words are counted in a hash table while the text is streamed line by line.
+When the table outgrows --memory-mb it is spilled to a sorted run on disk
+and the runs are merged at the end, so corpora larger than RAM work. The
+word counts are kept in lexicon_counts.tsv next to lexicon.txt; --update
+merges new text into them without re-reading the old text, and
+--min-count leaves rare words out of the lexicon.
+
+Output:
+-> lexicon.txt with "word<tab> w o r d |" lines (sorted by word)
+-> lexicon_counts.tsv with "word<tab>count" lines (sorted by word)
 """
 import os
-import codecs
-import re
-import pandas as pd
+import heapq
+import tempfile
 import argparse
 
+# Rough bytes per counted word on top of its length (dict entry, str and int objects)
+WORD_OVERHEAD = 120
+
+# Most run files open at once; more runs are first merged into one
+MERGE_FAN_IN = 64
+
+
+def iter_words(paths: list):
+    """
+    Streams the words of text files (one sentence per line).
+
+    :params: paths - list of text files (e.g. train.wrd, valid.wrd)
+    :returns: [generator] words
+    """
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                yield from line.split()
+
+
+def read_counts(path: str):
+    """
+    Streams a sorted "word<tab>count" file.
+
+    :returns: [generator] (word, count) tuples
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            word, count = line.rstrip('\n').rsplit('\t', 1)
+            yield word, int(count)
+
+
+def read_lexicon_words(path: str):
+    """
+    Streams the words of an existing lexicon.txt (for lexicons written
+    before counts were kept; each word counts once).
+
+    :returns: [generator] (word, 1) tuples sorted by word
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        words = sorted({line.split('\t', 1)[0] for line in file if line.strip()})
+    for word in words:
+        yield word, 1
+
+
+def merge_counts(streams: list):
+    """
+    Merges sorted (word, count) streams, adding up the counts of equal words.
+
+    :returns: [generator] (word, total count) tuples sorted by word
+    """
+    word, total = None, 0
+    for next_word, count in heapq.merge(*streams):
+        if next_word != word:
+            if word is not None:
+                yield word, total
+            word, total = next_word, 0
+        total += count
+    if word is not None:
+        yield word, total
+
+
+class VocabularyBuilder:
+    """
+    Counts words in a dict and spills it to sorted runs on disk whenever
+    its estimated size passes memory_mb. iter_counts merges the runs (and
+    any extra sorted (word, count) streams) into one sorted stream.
+    """
+    def __init__(self, memory_mb: float = 1024, tmp_dir: str = None):
+        self.budget = int(memory_mb * 1024 * 1024)
+        self.tmp = tempfile.TemporaryDirectory(dir=tmp_dir)
+        self.counts = {}
+        self.size = 0
+        self.runs = []
+        self.spills = 0
+
+    def add(self, word: str) -> None:
+        count = self.counts.get(word)
+        if count is None:
+            self.counts[word] = 1
+            self.size += len(word) + WORD_OVERHEAD
+            if self.size >= self.budget:
+                self.spill()
+        else:
+            self.counts[word] = count + 1
+
+    def spill(self) -> None:
+        """
+        Writes the in-memory counts to a sorted run file and clears them.
+        """
+        if not self.counts:
+            return
+        path = os.path.join(self.tmp.name, f"run{self.spills:05d}.tsv")
+        with open(path, 'w', encoding='utf-8') as file:
+            for word in sorted(self.counts):
+                file.write(f"{word}\t{self.counts[word]}\n")
+        self.runs.append(path)
+        self.spills += 1
+        self.counts = {}
+        self.size = 0
+        if len(self.runs) >= MERGE_FAN_IN:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Merges all run files into a single run.
+        """
+        path = os.path.join(self.tmp.name, f"merged{self.spills:05d}.tsv")
+        with open(path, 'w', encoding='utf-8') as file:
+            for word, count in merge_counts([read_counts(run) for run in self.runs]):
+                file.write(f"{word}\t{count}\n")
+        for run in self.runs:
+            os.remove(run)
+        self.runs = [path]
+
+    def iter_counts(self, extra: list = ()):
+        """
+        :params: extra - sorted (word, count) streams to merge in (e.g.
+        the counts of an existing lexicon)
+        :returns: [generator] (word, total count) tuples sorted by word
+        """
+        streams = [read_counts(path) for path in self.runs]
+        streams.append(iter(sorted(self.counts.items())))
+        streams.extend(extra)
+        return merge_counts(streams)
+
+    def close(self) -> None:
+        self.tmp.cleanup()
+
+
+def lexicon_line(word: str) -> str:
+    return word + '\t ' + ' '.join(word) + ' |'
+
+
+def write_lexicon(counts, lexicon_path: str, counts_path: str, min_count: int = 1) -> tuple:
+    """
+    Writes lexicon.txt (words seen at least min_count times) and the full
+    word counts, replacing both files only once they are complete.
+
+    :params: counts - (word, count) tuples sorted by word, lexicon_path -
+    lexicon file, counts_path - counts file, min_count - pruning threshold
+    :returns: [tuple] (words in lexicon, words counted)
+    """
+    kept = total = 0
+    with open(lexicon_path + '.tmp', 'w', encoding='utf-8') as lexicon, \
+            open(counts_path + '.tmp', 'w', encoding='utf-8') as counts_file:
+        for word, count in counts:
+            counts_file.write(f"{word}\t{count}\n")
+            total += 1
+            if count >= min_count:
+                lexicon.write(lexicon_line(word) + '\n')
+                kept += 1
+    os.replace(counts_path + '.tmp', counts_path)
+    os.replace(lexicon_path + '.tmp', lexicon_path)
+    return kept, total
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--train_dir", required=True)
-    parser.add_argument("--valid_dir", required=True)
+    parser.add_argument("--train_dir", help="Path to train.wrd")
+    parser.add_argument("--valid_dir", help="Path to valid.wrd")
+    parser.add_argument("--input", action="append", default=[], help="More text files to add (repeatable)")
     parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--min-count", default=1, type=int, help="Leave words seen fewer times out of lexicon.txt")
+    parser.add_argument("--memory-mb", default=1024, type=float, help="Approximate memory for word counts before spilling to disk")
+    parser.add_argument("--update", action="store_true", help="Merge the text into the existing lexicon counts instead of starting over")
     args = parser.parse_args()
 
+    paths = [p for p in (args.train_dir, args.valid_dir) if p is not None] + args.input
+    if not paths:
+        parser.error("give at least one of --train_dir, --valid_dir or --input")
     os.makedirs(args.output_dir, exist_ok=True)
+    lexicon_path = os.path.join(args.output_dir, 'lexicon.txt')
+    counts_path = os.path.join(args.output_dir, 'lexicon_counts.tsv')
+
+    builder = VocabularyBuilder(args.memory_mb, args.output_dir)
+    try:
+        for word in iter_words(paths):
+            builder.add(word)
+        extra = []
+        if args.update and os.path.exists(counts_path):
+            extra.append(read_counts(counts_path))
+        elif args.update and os.path.exists(lexicon_path):
+            extra.append(read_lexicon_words(lexicon_path))
+        kept, total = write_lexicon(builder.iter_counts(extra), lexicon_path, counts_path, args.min_count)
+    finally:
+        builder.close()
+    print(f"lexicon.txt written with {kept} words ({total} counted, {builder.spills} runs spilled to disk)")
 
-    df1 = pd.read_csv(args.train_dir, header=None)
-    df2 = pd.read_csv(args.valid_dir, header=None)
-
-    df1.columns = ['raw']
-    df2.columns = ['raw']
-
-    df1 = df1.drop_duplicates('raw',keep='last')
-    df2 = df2.drop_duplicates('raw',keep='last')
-
-    sentence1 = df1['raw'].to_list()
-    sentence2 = df2['raw'].to_list()
-    sentence = sentence1 + sentence2
-
-    word = []
-    for x in sentence:
-        tmp = x.split(' ')
-        for y in tmp:
-            if y not in word:
-                word.append(y)
-
-    lexicon = []
-    for x in range(len(word)):
-        wrd = word[x]
-        temp = []
-        for y in wrd:
-            temp.append(y)
-        result = ' '.join(temp) + ' |'
-        lexicon.append(wrd + '\t ' + result)
-    print(f"lexicon: {lexicon}")
-    file_to_save = f'{args.output_dir}/lexicon.txt'
-    f=codecs.open(file_to_save,'a+','utf8')
-    for x in lexicon:
-        f.write(x+'\n')
-    f.close()
 
 if __name__ == "__main__":
     main()
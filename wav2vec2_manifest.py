@@ -0,0 +1,281 @@
+"""
+Purpose: Creates the train.tsv/valid.tsv manifests fairseq needs to fine-tune
+         wav2vec2 (the input of modLibri_labels.py) from a folder of audio
+         files. Frame counts are read from the WAV/FLAC headers only, on a
+         thread pool, so no audio is decoded. Entries can be sorted or
+         length-bucketed so batches need less padding, and with --index
+         only new or changed files have their headers read again when the
+         dataset grows.
+
+         Parameters:
+            > root : Directory containing the audio files (give the
+                     directory *above* the speaker folders, see modLibri_labels.py)
+            > --dest : Directory to write train.tsv and valid.tsv to
+            > --ext : Audio file extension (wav or flac)
+            > --valid-percent : Fraction of files for valid.tsv (0 for none)
+            > --seed : Seed of the train/valid assignment and of bucket shuffling
+            > --path-must-contain : Only keep files whose path contains this string
+            > --workers : Threads reading headers
+            > --sort : none (path order), length (shortest first) or bucket
+            > --bucket-seconds : Width of a length bucket for --sort bucket
+            > --sample-rate : Sample rate used to convert --bucket-seconds to frames
+            > --index : SQLite file caching frame counts by path, size and mtime
+
+Output:
+    -> train.tsv and valid.tsv: root directory on the first line, then one
+       "relative path<tab>frames" line per file
+"""
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import soundfile
+except ImportError:
+    # Only needed for formats other than WAV and FLAC
+    soundfile = None
+
+
+def wav_frames(path: str) -> int:
+    """
+    Reads the frame count of a WAV file from its RIFF header.
+
+    :params: path - path to WAV file
+    :returns: [int] number of frames (samples per channel)
+    """
+    with open(path, "rb") as file:
+        riff, _, wave = struct.unpack("<4sI4s", file.read(12))
+        if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        block_align = None
+        data_size_64 = None
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"ds64":
+                # RF64: the real data size is in the ds64 chunk
+                data_size_64 = struct.unpack("<QQ", file.read(16))[1]
+                file.seek(size - 16 + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b"fmt ":
+                fmt = file.read(size)
+                block_align = struct.unpack("<H", fmt[12:14])[0]
+                if size & 1:
+                    file.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if block_align is None:
+                    raise ValueError(f"{path} has no fmt chunk before its data chunk")
+                if data_size_64 is not None:
+                    size = data_size_64
+                # Streamed files may leave the size unset or too large
+                size = min(size, os.path.getsize(path) - file.tell())
+                return size // block_align
+            else:
+                file.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def flac_frames(path: str) -> int:
+    """
+    Reads the frame count of a FLAC file from its STREAMINFO block.
+
+    :params: path - path to FLAC file
+    :returns: [int] number of frames (samples per channel)
+    """
+    with open(path, "rb") as file:
+        header = file.read(4)
+        if header[:3] == b"ID3":
+            # Skip an ID3v2 tag in front of the stream
+            rest = file.read(6)
+            tag_size = (rest[2] << 21) | (rest[3] << 14) | (rest[4] << 7) | rest[5]
+            file.seek(10 + tag_size)
+            header = file.read(4)
+        if header != b"fLaC":
+            raise ValueError(f"{path} is not a FLAC file")
+        block_header = file.read(4)
+        if block_header[0] & 0x7F != 0:
+            raise ValueError(f"{path} does not start with STREAMINFO")
+        streaminfo = file.read(34)
+        # 20 bits sample rate, 3 channels, 5 bits per sample, 36 total samples
+        packed = int.from_bytes(streaminfo[10:18], "big")
+        return packed & ((1 << 36) - 1)
+
+
+def audio_frames(path: str) -> int:
+    """
+    :returns: [int] frame count of an audio file, from its header only
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".wav":
+        return wav_frames(path)
+    if ext == ".flac":
+        return flac_frames(path)
+    if soundfile is None:
+        raise ImportError(f"soundfile is needed to read {ext} files (pip install soundfile)")
+    return soundfile.info(path).frames
+
+
+def scan_audio(root: str, ext: str, path_must_contain: str = None) -> list:
+    """
+    Lists the audio files under root with their size and modification time.
+
+    :params: root - audio directory, ext - file extension, path_must_contain -
+    (optional) substring every kept path must contain
+    :returns: [list] (path relative to root, size, mtime_ns) sorted by path
+    """
+    suffix = "." + ext.lower().lstrip(".")
+    files = []
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=True):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(suffix):
+                    if path_must_contain is not None and path_must_contain not in entry.path:
+                        continue
+                    stat = entry.stat()
+                    files.append((os.path.relpath(entry.path, root), stat.st_size, stat.st_mtime_ns))
+    files.sort()
+    return files
+
+
+def open_manifest_index(index_path: str) -> sqlite3.Connection:
+    """
+    Opens (or creates) the frame count cache. Each row holds the frames of
+    one file along with the size and modification time it had when read.
+
+    :params: index_path - path to SQLite database file
+    :returns: [sqlite3.Connection] open connection to the index
+    """
+    conn = sqlite3.connect(index_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS frames (root TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, frames INTEGER NOT NULL, PRIMARY KEY (root, path))"
+    )
+    return conn
+
+
+def count_frames(root: str, files: list, workers: int = 16, conn: sqlite3.Connection = None) -> dict:
+    """
+    Reads the frame counts of files, reusing cached counts for files whose
+    size and modification time are unchanged.
+
+    :params: root - audio directory, files - (path, size, mtime_ns) tuples,
+    workers - threads reading headers, conn - (optional) open manifest index
+    :returns: [dict] relative path -> frames
+    """
+    frames = {}
+    todo = files
+    if conn is not None:
+        cached = {path: (size, mtime_ns, n) for path, size, mtime_ns, n in
+                  conn.execute("SELECT path, size, mtime_ns, frames FROM frames WHERE root = ?", (root,))}
+        todo = []
+        for path, size, mtime_ns in files:
+            hit = cached.get(path)
+            if hit is not None and hit[:2] == (size, mtime_ns):
+                frames[path] = hit[2]
+            else:
+                todo.append((path, size, mtime_ns))
+        print(f"{len(frames)} cached, {len(todo)} new or changed files")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        counts = executor.map(audio_frames, (os.path.join(root, path) for path, _, _ in todo))
+        for (path, size, mtime_ns), n in zip(todo, counts):
+            frames[path] = n
+    if conn is not None:
+        conn.executemany("INSERT OR REPLACE INTO frames (root, path, size, mtime_ns, frames) VALUES (?, ?, ?, ?, ?)",
+                         [(root, path, size, mtime_ns, frames[path]) for path, size, mtime_ns in todo])
+        # Forget files that were deleted
+        present = {path for path, _, _ in files}
+        conn.executemany("DELETE FROM frames WHERE root = ? AND path = ?",
+                         [(root, path) for path in cached if path not in present])
+        conn.commit()
+    return frames
+
+
+def is_valid(path: str, valid_percent: float, seed) -> bool:
+    """
+    Assigns a file to valid.tsv from a hash of its path, so files keep
+    their split when the dataset grows.
+    """
+    digest = hashlib.blake2b(f"{seed}\0{path}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64 < valid_percent
+
+
+def order_entries(entries: list, sort: str, bucket_frames: int = 0, seed=0) -> list:
+    """
+    Orders manifest entries.
+
+    :params: entries - (path, frames) tuples, sort - none (keep order),
+    length (shortest first) or bucket (buckets of bucket_frames width,
+    shortest bucket first, shuffled within each bucket), bucket_frames -
+    bucket width in frames, seed - shuffle seed
+    :returns: [list] ordered entries
+    """
+    if sort == "length":
+        return sorted(entries, key=lambda entry: (entry[1], entry[0]))
+    if sort == "bucket":
+        rng = random.Random(seed)
+        buckets = {}
+        for entry in entries:
+            buckets.setdefault(entry[1] // max(1, bucket_frames), []).append(entry)
+        ordered = []
+        for key in sorted(buckets):
+            rng.shuffle(buckets[key])
+            ordered.extend(buckets[key])
+        return ordered
+    return entries
+
+
+def write_manifest(path: str, root: str, entries: list) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(root + "\n")
+        for rel_path, frames in entries:
+            file.write(f"{rel_path}\t{frames}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="Directory containing the audio files")
+    parser.add_argument("--dest", required=True, help="Directory to write train.tsv and valid.tsv to")
+    parser.add_argument("--ext", default="wav", help="Audio file extension (wav or flac; others need soundfile)")
+    parser.add_argument("--valid-percent", default=0.01, type=float, help="Fraction of files for valid.tsv (0 for none)")
+    parser.add_argument("--seed", default=42, type=int, help="Seed of the train/valid assignment and bucket shuffling")
+    parser.add_argument("--path-must-contain", default=None, help="Only keep files whose path contains this string")
+    parser.add_argument("--workers", default=16, type=int, help="Threads reading headers")
+    parser.add_argument("--sort", default="none", choices=["none", "length", "bucket"], help="Order of the entries")
+    parser.add_argument("--bucket-seconds", default=1.0, type=float, help="Width of a length bucket for --sort bucket")
+    parser.add_argument("--sample-rate", default=16000, type=int, help="Sample rate used to convert --bucket-seconds to frames")
+    parser.add_argument("--index", default=None, help="SQLite file caching frame counts; reruns only read new or changed files")
+    args = parser.parse_args()
+
+    os.makedirs(args.dest, exist_ok=True)
+    root = os.path.realpath(args.root)
+    start = time.time()
+    files = scan_audio(root, args.ext, args.path_must_contain)
+    print(f"Found {len(files)} .{args.ext} files in {time.time() - start:.1f}s")
+
+    conn = open_manifest_index(args.index) if args.index is not None else None
+    try:
+        frames = count_frames(root, files, args.workers, conn)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    train, valid = [], []
+    for path, _, _ in files:
+        (valid if is_valid(path, args.valid_percent, args.seed) else train).append((path, frames[path]))
+    bucket_frames = int(args.bucket_seconds * args.sample_rate)
+    write_manifest(os.path.join(args.dest, "train.tsv"), root, order_entries(train, args.sort, bucket_frames, args.seed))
+    if args.valid_percent > 0:
+        write_manifest(os.path.join(args.dest, "valid.tsv"), root, order_entries(valid, args.sort, bucket_frames, args.seed))
+    print(f"train.tsv: {len(train)} files, valid.tsv: {len(valid)} files ({time.time() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()